@@ -0,0 +1,63 @@
+"""
+Measure how crawl wall-clock time scales with the number of concurrent page fetches.
+
+The crawl runs against a local stand-in for the MediaWiki API that delays every request,
+so no network access is needed and the numbers are reproducible. Run from the repository root:
+
+    python -m benchmarks.crawl_concurrency --latency 0.1 --workers 1 2 4 8 16
+"""
+import argparse
+import time
+
+from benchmarks.fake_mediawiki import FakeMediaWikiServer, build_synthetic_wiki
+from src.acquisition.models.database_manager import DatabaseManager
+from src.acquisition.models.db.database import db, initialize_db
+from src.acquisition.wikipedia_crawler import WikipediaCategoryCrawler
+
+
+def run_crawl(server, main_category, max_workers):
+    if not db.is_closed():
+        db.close()
+    initialize_db()
+    db_manager = DatabaseManager(db)
+
+    crawler = WikipediaCategoryCrawler(main_category, db_manager, max_workers=max_workers, site=server.site())
+    requests_before = server.request_count
+    start = time.perf_counter()
+    crawler.crawl_category(depth=2)
+    elapsed = time.perf_counter() - start
+
+    revisions = db_manager.get_total_number_of_revisions_per_main_category(crawler.main_category_id)
+    return elapsed, server.request_count - requests_before, revisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.1, help='Simulated round-trip time in seconds')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--subcategories', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=25, help='Pages per category')
+    parser.add_argument('--revisions', type=int, default=40, help='Mean number of revisions per page')
+    args = parser.parse_args()
+
+    main_category = 'Synthetic'
+    wiki = build_synthetic_wiki(main_category, num_subcategories=args.subcategories,
+                                pages_per_category=args.pages, revisions_per_page=args.revisions)
+    server = FakeMediaWikiServer(wiki, latency=args.latency).start()
+
+    results = []
+    try:
+        for max_workers in args.workers:
+            results.append((max_workers, *run_crawl(server, main_category, max_workers)))
+    finally:
+        server.stop()
+
+    baseline = results[0][1]
+    print()
+    print(f"{'workers':>8} {'seconds':>9} {'requests':>9} {'revisions':>10} {'speedup':>8}")
+    for max_workers, elapsed, requests, revisions in results:
+        print(f"{max_workers:>8} {elapsed:>9.2f} {requests:>9} {revisions:>10} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
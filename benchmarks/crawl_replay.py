@@ -0,0 +1,82 @@
+"""
+Benchmark the crawl pipeline offline and deterministically by replaying a recorded crawl.
+
+First record the API responses of a crawl once, live from en.wikipedia.org or from the local
+stand-in for the MediaWiki API (--synthetic), then replay them as often as needed. Replaying
+needs no network access and is not paced, so it measures the crawler and the database writes
+only. Run from the repository root:
+
+    python -m benchmarks.crawl_replay record --category "Amiga CD32 games" --cache outputs/http_cache/amiga
+    python -m benchmarks.crawl_replay replay --category "Amiga CD32 games" --cache outputs/http_cache/amiga --repeat 3
+"""
+import argparse
+import time
+
+import mwclient
+
+from benchmarks.fake_mediawiki import FakeMediaWikiServer, build_synthetic_wiki
+from src.acquisition.models.database_manager import DatabaseManager
+from src.acquisition.models.db.database import db, initialize_db
+from src.acquisition.wikipedia_crawler import WikipediaCategoryCrawler
+
+# The synthetic wiki is served on a fixed port, recorded responses are keyed by the full URL
+SYNTHETIC_PORT = 8765
+
+
+def run_crawl(args, mode, site=None):
+    if not db.is_closed():
+        db.close()
+    initialize_db()
+    db_manager = DatabaseManager(db)
+
+    crawler = WikipediaCategoryCrawler(args.category, db_manager, max_workers=args.workers, site=site,
+                                       http_cache=args.cache, http_cache_mode=mode)
+    start = time.perf_counter()
+    crawler.crawl_category(depth=args.depth)
+    elapsed = time.perf_counter() - start
+
+    revisions = db_manager.get_total_number_of_revisions_per_main_category(crawler.main_category_id)
+    return elapsed, crawler.http_cache.stats(), revisions, db_manager.get_write_stats()
+
+
+def synthetic_site():
+    return mwclient.Site(f'127.0.0.1:{SYNTHETIC_PORT}', scheme='http', path='/w/', do_init=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('--category', default='Amiga CD32 games')
+    parser.add_argument('--cache', default='outputs/http_cache', help='Directory of the recorded responses')
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help='Number of replayed crawls')
+    parser.add_argument('--synthetic', action='store_true', help='Record from a local synthetic wiki instead')
+    args = parser.parse_args()
+
+    if args.mode == 'record':
+        server = None
+        if args.synthetic:
+            wiki = build_synthetic_wiki(args.category)
+            server = FakeMediaWikiServer(wiki, port=SYNTHETIC_PORT).start()
+        try:
+            elapsed, cache_stats, revisions, _ = run_crawl(args, 'record', synthetic_site() if args.synthetic else None)
+        finally:
+            if server is not None:
+                server.stop()
+        print(f'\nRecorded {cache_stats["recorded"]} responses, {revisions} revisions in {elapsed:.2f}s')
+        return
+
+    results = []
+    for _ in range(args.repeat):
+        results.append(run_crawl(args, 'replay', synthetic_site() if args.synthetic else None))
+
+    print()
+    print(f"{'run':>4} {'seconds':>9} {'responses':>10} {'revisions':>10} {'revisions/s':>12} {'rows/s':>9}")
+    for run, (elapsed, cache_stats, revisions, write_stats) in enumerate(results, start=1):
+        print(f"{run:>4} {elapsed:>9.2f} {cache_stats['hits']:>10} {revisions:>10} "
+              f"{revisions / elapsed:>12.0f} {write_stats['rows_per_second']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
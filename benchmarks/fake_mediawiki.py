@@ -0,0 +1,317 @@
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import mwclient
+
+
+class FakeWiki:
+    """In-memory stand-in for the parts of a MediaWiki installation the crawler reads."""
+
+    def __init__(self):
+        self.categories = {}
+        self.pages = {}
+        self._next_page_id = 1
+        self._next_revision_id = 1
+
+    def add_category(self, name, parent=None):
+        title = f'Category:{name}'
+        if title not in self.categories:
+            self.categories[title] = {'pageid': self._new_page_id(), 'members': []}
+        if parent is not None:
+            self.categories[f'Category:{parent}']['members'].append(title)
+        return title
+
+    def add_page(self, title, category, revisions):
+        """Add an article with `revisions` given as (user, timestamp) tuples, oldest first."""
+        if title not in self.pages:
+            self.pages[title] = {'pageid': self._new_page_id(), 'revisions': []}
+            for user, timestamp in revisions:
+                self.pages[title]['revisions'].insert(0, {
+                    'revid': self._new_revision_id(),
+                    'user': user,
+                    'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                })
+        self.categories[f'Category:{category}']['members'].append(title)
+        return title
+
+    def edit_page(self, title, user, timestamp):
+        """Append a new revision to an existing article."""
+        self.pages[title]['revisions'].insert(0, {
+            'revid': self._new_revision_id(),
+            'user': user,
+            'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+
+    def info(self, title):
+        if title in self.categories:
+            return {'pageid': self.categories[title]['pageid'], 'ns': 14, 'title': title}
+        if title in self.pages:
+            page = self.pages[title]
+            return {
+                'pageid': page['pageid'],
+                'ns': 0,
+                'title': title,
+                'lastrevid': page['revisions'][0]['revid'] if page['revisions'] else 0,
+            }
+        return {'ns': 0, 'title': title, 'missing': ''}
+
+    def _new_page_id(self):
+        self._next_page_id += 1
+        return self._next_page_id - 1
+
+    def _new_revision_id(self):
+        self._next_revision_id += 1
+        return self._next_revision_id - 1
+
+
+def build_synthetic_wiki(main_category='Synthetic', num_subcategories=4, pages_per_category=25,
+                         revisions_per_page=40, num_users=500, seed=0):
+    """Create a two-level category tree with Zipf-distributed editors and repeated pages."""
+    rng = random.Random(seed)
+    wiki = FakeWiki()
+    wiki.add_category(main_category)
+    users = [f'User {i}' for i in range(num_users)]
+    weights = [1 / (rank + 1) for rank in range(num_users)]
+    start = datetime(2005, 1, 1, tzinfo=timezone.utc)
+
+    categories = [main_category]
+    for idx in range(num_subcategories):
+        name = f'{main_category} {idx}'
+        wiki.add_category(name, parent=main_category)
+        categories.append(name)
+
+    page_number = 0
+    for category in categories:
+        for _ in range(pages_per_category):
+            page_number += 1
+            count = max(1, int(rng.expovariate(1 / revisions_per_page)))
+            editors = rng.choices(users, weights=weights, k=count)
+            timestamps = sorted(start + timedelta(days=rng.uniform(0, 7000)) for _ in range(count))
+            wiki.add_page(f'Article {page_number}', category, zip(editors, timestamps))
+
+        # Articles are often filed under several subcategories of the same main category
+        if category != main_category:
+            wiki.add_page(f'Article {rng.randint(1, pages_per_category)}', category, [])
+
+    return wiki
+
+
+class FakeMediaWikiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond(dict(parse_qsl(urlparse(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self._respond(dict(parse_qsl(self.rfile.read(length).decode())))
+
+    def _respond(self, params):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.in_flight += 1
+            overloaded = server.max_concurrent_requests and server.in_flight > server.max_concurrent_requests
+            failing = overloaded or server.rng.random() < server.failure_rate
+            status = server.rng.choice(server.failure_statuses)
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+
+            if failing:
+                with server.lock:
+                    server.failure_count += 1
+                headers = {'Retry-After': str(server.retry_after)} if server.retry_after is not None else {}
+                self._send_json(status, {'error': {'code': 'ratelimited', 'info': 'Too many requests'}}, headers)
+            elif 'maxlag' in params and server.replication_lag > float(params['maxlag']):
+                with server.lock:
+                    server.failure_count += 1
+                headers = {
+                    'Retry-After': '1',
+                    'X-Database-Lag': str(server.replication_lag),
+                    'MediaWiki-API-Error': 'maxlag',
+                }
+                error = {'code': 'maxlag', 'info': f'Waiting for a database server: {server.replication_lag} seconds lagged.'}
+                self._send_json(200, {'error': error}, headers)
+            else:
+                self._send_json(200, server.api(params))
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeMediaWikiServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering the MediaWiki API calls mwclient issues while crawling.
+
+    Every request is delayed by `latency` seconds to simulate the network round trip to
+    en.wikipedia.org, so crawl wall-clock time is dominated by latency just like in production.
+
+    Throttling can be injected: a share `failure_rate` of the requests, and every request beyond
+    `max_concurrent_requests` in flight, fails with one of `failure_statuses`, optionally with a
+    Retry-After header. While `replication_lag` exceeds the maxlag parameter of a request, the
+    request is refused with a maxlag error like MediaWiki does.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, wiki, latency=0.0, failure_rate=0.0, failure_statuses=(429, 503), retry_after=None,
+                 max_concurrent_requests=None, host='127.0.0.1', port=0, seed=0):
+        super().__init__((host, port), FakeMediaWikiHandler)
+        self.wiki = wiki
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_statuses = failure_statuses
+        self.retry_after = retry_after
+        self.max_concurrent_requests = max_concurrent_requests
+        self.replication_lag = 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.failure_count = 0
+        self.in_flight = 0
+
+    @property
+    def host(self):
+        return f'{self.server_address[0]}:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are expected, everything else is reported
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def site(self, **kwargs):
+        return mwclient.Site(self.host, scheme='http', path='/w/', **kwargs)
+
+    def api(self, params):
+        if params.get('action') != 'query':
+            return {'error': {'code': 'unknown_action', 'info': 'Unsupported action'}}
+        if 'siteinfo' in params.get('meta', ''):
+            return self._siteinfo()
+        if params.get('generator') == 'categorymembers':
+            response = self._category_members(params)
+        elif params.get('list') == 'categorymembers':
+            response = self._category_member_list(params)
+        elif params.get('prop') == 'categoryinfo':
+            response = self._category_info(params)
+        elif params.get('prop') == 'revisions':
+            response = self._revisions(params)
+        elif params.get('prop') == 'info':
+            response = self._info(params)
+        else:
+            return {'error': {'code': 'badparams', 'info': f'Unsupported query: {params}'}}
+        if 'error' in response:
+            return response
+
+        # mwclient piggybacks meta=userinfo on every query
+        response['query']['userinfo'] = {'id': 0, 'name': '127.0.0.1', 'anon': ''}
+        return response
+
+    def _siteinfo(self):
+        return {'query': {
+            'general': {'generator': 'MediaWiki 1.43.0', 'sitename': 'Fake Wikipedia'},
+            'namespaces': {
+                '0': {'id': 0, '*': ''},
+                '6': {'id': 6, '*': 'File'},
+                '14': {'id': 14, '*': 'Category'},
+            },
+            'userinfo': {'id': 0, 'name': '127.0.0.1', 'anon': ''},
+        }}
+
+    def _info(self, params):
+        pages = {}
+        for idx, title in enumerate(params.get('titles', '').split('|')):
+            info = self.wiki.info(title)
+            pages[str(info.get('pageid', -1 - idx))] = info
+        return {'query': {'pages': pages}}
+
+    def _category_members(self, params):
+        members = self.wiki.categories.get(params['gcmtitle'], {'members': []})['members']
+        offset = int(params.get('gcmcontinue', 0))
+        limit = int(params.get('gcmlimit', 500))
+        chunk = members[offset:offset + limit]
+        response = {'query': {'pages': {str(info['pageid']): info for info in map(self.wiki.info, chunk)}}}
+        if offset + limit < len(members):
+            response['continue'] = {'gcmcontinue': str(offset + limit), 'continue': 'gcmcontinue||'}
+        return response
+
+    def _category_member_list(self, params):
+        members = self.wiki.categories.get(params['cmtitle'], {'members': []})['members']
+        if params.get('cmtype') == 'subcat':
+            members = [title for title in members if title in self.wiki.categories]
+        offset = int(params.get('cmcontinue', 0))
+        limit = 500 if params.get('cmlimit', '500') == 'max' else int(params.get('cmlimit', 500))
+        chunk = [{'ns': self.wiki.info(title)['ns'], 'title': title} for title in members[offset:offset + limit]]
+        response = {'query': {'categorymembers': chunk}}
+        if offset + limit < len(members):
+            response['continue'] = {'cmcontinue': str(offset + limit), 'continue': '-||'}
+        return response
+
+    def _category_info(self, params):
+        pages = {}
+        for idx, title in enumerate(params.get('titles', '').split('|')):
+            info = self.wiki.info(title)
+            if title in self.wiki.categories:
+                members = self.wiki.categories[title]['members']
+                subcats = sum(1 for member in members if member in self.wiki.categories)
+                info['categoryinfo'] = {'size': len(members), 'pages': len(members) - subcats, 'files': 0, 'subcats': subcats}
+            pages[str(info.get('pageid', -1 - idx))] = info
+        return {'query': {'pages': pages}}
+
+    def _revisions(self, params):
+        info = self.wiki.info(params['titles'])
+        revisions = self.wiki.pages.get(params['titles'], {'revisions': []})['revisions']
+        props = params.get('rvprop', 'ids|timestamp|flags|comment|user').split('|')
+        if params.get('rvdir') == 'newer':
+            revisions = revisions[::-1]
+        if 'rvstartid' in params:
+            start_id = int(params['rvstartid'])
+            # Like MediaWiki, the start id has to be a revision of the page
+            if start_id not in {revision['revid'] for revision in revisions}:
+                return {'error': {'code': 'badid', 'info': f'No revision with ID {start_id}.'}}
+            if params.get('rvdir') == 'newer':
+                revisions = [r for r in revisions if r['revid'] >= start_id]
+            else:
+                revisions = [r for r in revisions if r['revid'] <= start_id]
+
+        offset = int(params.get('rvcontinue', 0))
+        limit = min(int(params.get('rvlimit', 50)), 500)
+        chunk = []
+        for revision in revisions[offset:offset + limit]:
+            item = {'revid': revision['revid']} if 'ids' in props else {}
+            item.update({k: revision[k] for k in ('user', 'timestamp') if k in props})
+            if 'comment' in props:
+                item['comment'] = ''
+            chunk.append(item)
+
+        info['revisions'] = chunk
+        response = {'query': {'pages': {str(info.get('pageid', -1)): info}}}
+        if offset + limit < len(revisions):
+            response['continue'] = {'rvcontinue': str(offset + limit), 'continue': '||'}
+        return response
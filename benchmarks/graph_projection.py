@@ -0,0 +1,107 @@
+"""
+Compare the engines of ContributorGraphBuilder on a synthetic database the size of
+"Machine learning": the aggregate SQL query, the sparse matrix product B·Bᵀ and the same
+product out of core in a process pool under a memory budget. Only the edge lists are computed,
+so graph-tool is not needed. Run from the repository root:
+
+    python -m benchmarks.graph_projection --weighted --memory-budget 1024 --workers 2
+
+With projection options, e.g. --max-page-contributors 1000 or --backbone disparity, only the
+sparse and the out-of-core engine run, and the shrinkage of the projection report is printed.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_db import populate_database
+from src.acquisition.graph_tool.projection import (
+    ProjectionOptions, iter_edge_runs, iter_projection_edges, load_incidence, project_out_of_core
+)
+from src.acquisition.models.database_manager import DatabaseManager
+from src.acquisition.models.db.database import db, initialize_db
+
+
+def sql_edges(db_manager, main_category_id, weighted):
+    return db_manager.iter_co_contribution_edges(main_category_id, weighted=weighted)
+
+
+def sparse_edges(db_manager, main_category_id, weighted, options=None, report=None):
+    contributor_ids, incidence = load_incidence(db_manager, main_category_id)
+    for edges in iter_projection_edges(incidence, weighted=weighted, options=options, report=report):
+        # Map the rows back to contributor ids to compare with the SQL engine
+        edges[:, :2] = contributor_ids[edges[:, :2]]
+        yield edges
+
+
+def out_of_core_edges(db_manager, main_category_id, weighted, directory, memory_budget, workers, options=None):
+    contributor_ids, incidence = load_incidence(db_manager, main_category_id)
+    result = project_out_of_core(incidence, directory, weighted=weighted, memory_budget=memory_budget, max_workers=workers,
+                                 options=options)
+    for edges in iter_edge_runs(result['directory']):
+        edges[:, :2] = contributor_ids[edges[:, :2]]
+        yield edges
+
+
+def digest(edge_chunks):
+    """Number of edges and hash of the edge list, which does not depend on the chunk sizes."""
+    sha, count = hashlib.sha256(), 0
+    for edges in edge_chunks:
+        sha.update(edges.astype('<i8').tobytes())
+        count += len(edges)
+    return count, sha.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weighted', action='store_true')
+    parser.add_argument('--database', help='Existing database to use instead of a synthetic one')
+    parser.add_argument('--category', type=int, default=1, help='Main category id in --database')
+    parser.add_argument('--engines', nargs='+', default=['sql', 'sparse', 'out-of-core'],
+                        choices=['sql', 'sparse', 'out-of-core'])
+    parser.add_argument('--memory-budget', type=int, default=1024, help='MB for the out-of-core workers together')
+    parser.add_argument('--workers', type=int, default=None, help='Processes of the out-of-core engine')
+    parser.add_argument('--max-page-contributors', type=int, default=None, help='Drop pages with more contributors')
+    parser.add_argument('--weighting', default='revisions', choices=ProjectionOptions.WEIGHTINGS)
+    parser.add_argument('--backbone', default=None, choices=[backbone for backbone in ProjectionOptions.BACKBONES if backbone])
+    parser.add_argument('--alpha', type=float, default=0.05, help='Significance level of the backbone')
+    args = parser.parse_args()
+    options = ProjectionOptions(max_page_contributors=args.max_page_contributors, weighting=args.weighting,
+                                backbone=args.backbone, alpha=args.alpha)
+    if not options.is_default() and 'sql' in args.engines:
+        # The aggregate query has no projection options
+        args.engines.remove('sql')
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.database:
+            initialize_db(os.path.abspath(args.database), profile='analysis', read_only=True)
+            db_manager = DatabaseManager(db)
+            main_category_id = args.category
+        else:
+            initialize_db(os.path.join(directory, 'projection.db'), profile='analysis')
+            db_manager = DatabaseManager(db)
+            main_category_id = populate_database(db_manager)
+
+        engines = {
+            'sql': lambda: sql_edges(db_manager, main_category_id, args.weighted),
+            'sparse': lambda: sparse_edges(db_manager, main_category_id, args.weighted, options, report),
+            'out-of-core': lambda: out_of_core_edges(db_manager, main_category_id, args.weighted, os.path.join(directory, 'runs'),
+                                                     args.memory_budget * 1024 ** 2, args.workers, options),
+        }
+        report = {}
+        results = {}
+        for engine in args.engines:
+            start = time.perf_counter()
+            count, results[engine] = digest(engines[engine]())
+            seconds = time.perf_counter() - start
+            print(f'{engine:>11}: {count} edges in {seconds:.2f}s')
+        db.close()
+
+    if report:
+        print(f"Projection report: {report}")
+    print(f"Identical edge lists: {len(set(results.values())) == 1}")
+
+
+if __name__ == '__main__':
+    main()
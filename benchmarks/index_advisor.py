@@ -0,0 +1,107 @@
+"""
+Compare the index set of the models with the hand-made indexes of earlier versions on a
+synthetic database the size of "Machine learning": insert throughput of the crawl and time of
+the hot analysis queries. Afterwards the query plans of the current index set are checked
+with DatabaseManager.check_query_plans, which fails if a hot query falls back to a full scan.
+Run from the repository root:
+
+    python -m benchmarks.index_advisor
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_db import MACHINE_LEARNING, populate_database
+from src.acquisition.models.database_manager import DatabaseManager
+from src.acquisition.models.db.database import db, initialize_db
+
+# Indexes on revision before the covering index set, including the duplicate of the primary key
+LEGACY_INDEXES = [
+    'CREATE INDEX legacy_main_category ON revision (main_category_id)',
+    'CREATE INDEX legacy_page ON revision (page_id)',
+    'CREATE INDEX legacy_contributor ON revision (contributor_id)',
+    'CREATE UNIQUE INDEX legacy_id_main_category ON revision (id, main_category_id)',
+    'CREATE INDEX legacy_contributor_main_category ON revision (contributor_id, main_category_id)',
+    'CREATE INDEX legacy_page_main_category ON revision (page_id, main_category_id)',
+    'CREATE INDEX legacy_idx_revision_contributor_category ON revision (contributor_id, main_category_id)',
+    'CREATE INDEX legacy_idx_revision_page_category ON revision (page_id, main_category_id)',
+    'CREATE INDEX legacy_main_category_timestamp_epoch ON revision (main_category_id, timestamp_epoch)',
+]
+
+
+def timed(function, repeat=3):
+    """Best time of repeat runs, generators are consumed completely."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        if hasattr(result, '__next__'):
+            for _ in result:
+                pass
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_index_set(directory, index_set, revisions):
+    if not db.is_closed():
+        db.close()
+    initialize_db(os.path.join(directory, f'{index_set}.db'), profile='crawl')
+    db_manager = DatabaseManager(db)
+    if index_set == 'legacy':
+        for statement in LEGACY_INDEXES:
+            db.execute_sql(statement)
+
+    start = time.perf_counter()
+    main_category_id = populate_database(db_manager, revisions=revisions)
+    insert_seconds = time.perf_counter() - start
+    rows_per_second = db_manager.get_write_stats()['rows_per_second']
+    db_manager.update_statistics()
+
+    contributor_id = db.execute_sql(
+        'SELECT contributor_id FROM pagecontributor WHERE main_category_id = ? ORDER BY revisions DESC LIMIT 1',
+        (main_category_id,)
+    ).fetchone()[0]
+    window = ('2012-01-01', '2013-01-01')
+    queries = {
+        'co-contributors': lambda: db_manager.get_co_contributors_weighted(contributor_id, main_category_id),
+        'contributors per page': lambda: db_manager.get_distinct_contributors_per_page(main_category_id),
+        'monthly stats': lambda: db_manager.get_activity_stats(main_category_id),
+        'contributor stats': lambda: db_manager.get_activity_stats(main_category_id, contributor_ids=[contributor_id]),
+        'window stats': lambda: db_manager.get_activity_stats(main_category_id, start=window[0], end=window[1]),
+        'min/max timestamps': lambda: db_manager.get_oldest_and_newest_revision_per_contributor_and_main_category(
+            contributor_id, main_category_id),
+        'window edges': lambda: db_manager.iter_co_contribution_edges(main_category_id, start=window[0], end=window[1]),
+    }
+    query_seconds = {name: timed(query) for name, query in queries.items()}
+
+    plans = db_manager.check_query_plans(main_category_id) if index_set == 'current' else None
+    db.close()
+    return insert_seconds, rows_per_second, query_seconds, plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--revisions', type=int, default=MACHINE_LEARNING['revisions'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {index_set: run_index_set(directory, index_set, args.revisions) for index_set in ('legacy', 'current')}
+
+    queries = list(results['current'][2])
+    print()
+    print(f"{'indexes':>8} {'insert s':>9} {'rows/s':>9} " + ' '.join(f'{query + " ms":>21}' for query in queries))
+    for index_set, (insert_seconds, rows_per_second, query_seconds, _) in results.items():
+        print(f"{index_set:>8} {insert_seconds:>9.2f} {rows_per_second:>9.0f} "
+              + ' '.join(f'{query_seconds[query] * 1000:>21.1f}' for query in queries))
+
+    print()
+    print('Query plans of the current index set (no full scans):')
+    for name, lines in results['current'][3].items():
+        print(f'  {name}')
+        for line in lines:
+            print(f'    {line}')
+
+
+if __name__ == '__main__':
+    main()
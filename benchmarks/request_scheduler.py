@@ -0,0 +1,51 @@
+"""
+Crawl against a local stand-in for the MediaWiki API that throttles and fails requests, and
+report how the request scheduler copes: retries, adapted concurrency and latency percentiles.
+Run from the repository root:
+
+    python -m benchmarks.request_scheduler --failure-rate 0.05 --max-concurrent 4 --workers 8
+"""
+import argparse
+import time
+
+from benchmarks.fake_mediawiki import FakeMediaWikiServer, build_synthetic_wiki
+from src.acquisition.models.database_manager import DatabaseManager
+from src.acquisition.models.db.database import db, initialize_db
+from src.acquisition.request_scheduler import RequestScheduler
+from src.acquisition.wikipedia_crawler import WikipediaCategoryCrawler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated round-trip time in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='Share of requests failing with 429/503')
+    parser.add_argument('--retry-after', type=float, default=None, help='Retry-After sent with failures')
+    parser.add_argument('--max-concurrent', type=int, default=4, help='Concurrent requests the server accepts')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=None, help='Target requests per second')
+    args = parser.parse_args()
+
+    wiki = build_synthetic_wiki('Synthetic')
+    server = FakeMediaWikiServer(wiki, latency=args.latency, failure_rate=args.failure_rate,
+                                 retry_after=args.retry_after, max_concurrent_requests=args.max_concurrent).start()
+    initialize_db()
+    db_manager = DatabaseManager(db)
+    scheduler = RequestScheduler(requests_per_second=args.rate, max_concurrency=args.workers, backoff_base=0.1)
+    crawler = WikipediaCategoryCrawler('Synthetic', db_manager, max_workers=args.workers,
+                                       site=server.site(), scheduler=scheduler)
+
+    start = time.perf_counter()
+    try:
+        crawler.crawl_category(depth=2)
+    finally:
+        server.stop()
+    elapsed = time.perf_counter() - start
+
+    print()
+    print(f'Crawl finished in {elapsed:.2f}s, the server failed {server.failure_count} of {server.request_count} requests')
+    for name, value in scheduler.get_metrics().items():
+        print(f'{name:>20}: {value:.3f}' if isinstance(value, float) else f'{name:>20}: {value}')
+
+
+if __name__ == '__main__':
+    main()
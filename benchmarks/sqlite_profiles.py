@@ -0,0 +1,68 @@
+"""
+Compare the insert and aggregation throughput of the SQLite profiles of initialize_db on a
+synthetic database the size of "Machine learning". Every profile gets a fresh database file
+in a temporary directory. Run from the repository root:
+
+    python -m benchmarks.sqlite_profiles --profiles default crawl analysis
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_db import MACHINE_LEARNING, populate_database
+from src.acquisition.models.database_manager import DatabaseManager
+from src.acquisition.models.db.database import PROFILES, db, initialize_db
+
+# Distinct (page, contributor) pairs with their edit counts, the input of the graph builder
+INCIDENCE_QUERY = '''
+    SELECT page_id, contributor_id, COUNT(*) FROM revision
+    WHERE main_category_id = ? GROUP BY page_id, contributor_id
+'''
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run_profile(directory, profile, revisions):
+    if not db.is_closed():
+        db.close()
+    initialize_db(os.path.join(directory, f'{profile}.db'), profile=profile)
+    db_manager = DatabaseManager(db)
+
+    start = time.perf_counter()
+    main_category_id = populate_database(db_manager, revisions=revisions)
+    insert_seconds = time.perf_counter() - start
+    write_stats = db_manager.get_write_stats()
+
+    aggregations = {
+        'monthly stats': timed(db_manager.get_unique_stats_per_month, main_category_id),
+        'contributors per page': timed(db_manager.get_distinct_contributors_per_page, main_category_id),
+        'page-contributor pairs': timed(lambda: db.execute_sql(INCIDENCE_QUERY, (main_category_id,)).fetchall()),
+    }
+    db.close()
+    return insert_seconds, write_stats['rows_per_second'], aggregations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--revisions', type=int, default=MACHINE_LEARNING['revisions'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [(profile, *run_profile(directory, profile, args.revisions)) for profile in args.profiles]
+
+    queries = list(results[0][3])
+    print()
+    print(f"{'profile':>10} {'insert s':>9} {'rows/s':>9} " + ' '.join(f'{query + " s":>24}' for query in queries))
+    for profile, insert_seconds, rows_per_second, aggregations in results:
+        print(f"{profile:>10} {insert_seconds:>9.2f} {rows_per_second:>9.0f} "
+              + ' '.join(f'{aggregations[query]:>24.2f}' for query in queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Fill a database with synthetic revisions shaped like a crawled category, for database and
+graph benchmarks that must not depend on a crawl. The defaults match "Machine learning":
+1548 pages, 75217 contributors and 273260 revisions.
+
+Contributor activity and page popularity are heavy-tailed (lognormal) like on Wikipedia,
+a few contributors make a large share of the edits and a few pages get a large share of them.
+"""
+import numpy as np
+from datetime import datetime, timedelta, timezone
+
+MACHINE_LEARNING = {'pages': 1548, 'contributors': 75217, 'revisions': 273260}
+
+
+def populate_database(db_manager, main_category='Synthetic', pages=MACHINE_LEARNING['pages'],
+                      contributors=MACHINE_LEARNING['contributors'], revisions=MACHINE_LEARNING['revisions'],
+                      seed=0):
+    """
+    Write synthetic pages, contributors and revisions through the buffered write path.
+
+    Returns:
+        Id of the main category the revisions belong to
+    """
+    rng = np.random.default_rng(seed)
+    main_category_id = db_manager.get_or_create_main_category(main_category).id
+
+    page_weights = rng.lognormal(sigma=1.2, size=pages)
+    contributor_weights = rng.lognormal(sigma=2.0, size=contributors)
+    page_ids = rng.choice(pages, size=revisions, p=page_weights / page_weights.sum()) + 1
+    contributor_ids = rng.choice(contributors, size=revisions, p=contributor_weights / contributor_weights.sum()) + 1
+    # Every contributor edits at least once
+    contributor_ids[:contributors] = rng.permutation(contributors) + 1
+    rng.shuffle(contributor_ids)
+    start = datetime(2002, 1, 1, tzinfo=timezone.utc)
+    seconds = np.sort(rng.integers(0, 22 * 365 * 24 * 3600, revisions))
+
+    for page_id in range(1, pages + 1):
+        db_manager.add_page(page_id=page_id, page_name=f'{main_category} page {page_id}')
+    for revision_id, (page_id, contributor_id, offset) in enumerate(zip(page_ids, contributor_ids, seconds), start=1):
+        timestamp = (start + timedelta(seconds=int(offset))).strftime('%Y-%m-%dT%H:%M:%SZ')
+        db_manager.add_revision(revision_id=revision_id, page_id=int(page_id), username=f'User {contributor_id}',
+                                timestamp=timestamp, main_category_id=main_category_id)
+    db_manager.flush()
+    return main_category_id
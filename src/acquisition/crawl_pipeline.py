@@ -0,0 +1,161 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+class PipelineStopped(Exception):
+    """Raised in the fetch workers once the writer has given up, so they stop fetching."""
+
+
+class CrawlPipeline:
+    """
+    Producer/consumer pipeline overlapping the HTTP fetches with the database writes.
+
+    Fetch workers turn every item into batches of records and push them into a bounded queue.
+    When the queue is full the workers block, so fetching never runs more than queue_size
+    batches ahead of the writes. All batches are drained by a single writer, the thread calling
+    run(), which is the only thread touching the database. Each item ends with a marker message,
+    the writer stops once it has seen the marker of every item.
+
+    The time each stage spends working and waiting on the other stage is recorded, so the
+    bottleneck of a crawl can be read off get_stats().
+    """
+
+    _DONE = object()
+
+    def __init__(self, produce, consume, complete, max_workers=1, queue_size=64, fail=None):
+        """
+        Args:
+            produce: Callable turning an item into an iterable of record batches, run by the fetch workers
+            consume: Callable(item, batch) storing one batch, run by the writer
+            complete: Callable(item) run by the writer after the last batch of an item
+            max_workers: Number of fetch workers
+            queue_size: Maximal number of batches waiting for the writer
+            fail: Optional callable(item, error) run by the writer instead of complete if the fetch of an
+                item failed, the other items go on. Without it the first failed fetch stops the pipeline.
+        """
+        self.produce = produce
+        self.consume = consume
+        self.complete = complete
+        self.fail = fail
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+
+        self._queue = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.failed_items = 0
+        self.fetched_records = 0
+        self.fetch_seconds = 0.0     # summed over all fetch workers
+        self.fetch_blocked_seconds = 0.0
+        self.written_records = 0
+        self.write_seconds = 0.0
+        self.write_idle_seconds = 0.0
+        self.max_queue_depth = 0
+        self.elapsed_seconds = 0.0
+
+    def run(self, items, progress=None):
+        """
+        Fetch and store all items, returning once every batch has been handed to the writer.
+
+        Args:
+            items: Items to process, e.g. pages
+            progress: Optional callable invoked by the writer after every completed item
+
+        Raises:
+            The first exception of the writer, or of a fetch worker if there is no fail callable,
+            after all workers stopped
+        """
+        items = list(items)
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._stopped.clear()
+        start = perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in items:
+                executor.submit(self._fetch, item)
+            try:
+                self._write(len(items), progress)
+            finally:
+                # Unblocks workers waiting on a full queue if the writer failed
+                self._stopped.set()
+
+        self.elapsed_seconds += perf_counter() - start
+
+    def _fetch(self, item):
+        error = None
+        try:
+            if self._stopped.is_set():
+                raise PipelineStopped()
+            started = perf_counter()
+            for batch in self.produce(item):
+                batch = list(batch)
+                fetched = perf_counter()
+                self._put((item, batch))
+                with self._lock:
+                    self.fetched_records += len(batch)
+                    self.fetch_seconds += fetched - started
+                started = perf_counter()
+            with self._lock:
+                self.fetch_seconds += perf_counter() - started
+        except PipelineStopped:
+            return
+        except Exception as e:
+            error = e
+        try:
+            self._put((item, self._DONE, error))
+        except PipelineStopped:
+            pass
+
+    def _put(self, message):
+        started = perf_counter()
+        while True:
+            try:
+                self._queue.put(message, timeout=0.1)
+                break
+            except queue.Full:
+                if self._stopped.is_set():
+                    raise PipelineStopped()
+        with self._lock:
+            self.fetch_blocked_seconds += perf_counter() - started
+
+    def _write(self, number_of_items, progress):
+        completed = 0
+        while completed < number_of_items:
+            waiting = perf_counter()
+            message = self._queue.get()
+            started = perf_counter()
+            self.write_idle_seconds += started - waiting
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize() + 1)
+
+            item, batch = message[0], message[1]
+            if batch is self._DONE:
+                if message[2] is None:
+                    self.complete(item)
+                elif self.fail is None:
+                    raise message[2]
+                else:
+                    self.fail(item, message[2])
+                    self.failed_items += 1
+                completed += 1
+                if progress is not None:
+                    progress()
+            else:
+                self.consume(item, batch)
+                self.written_records += len(batch)
+            self.write_seconds += perf_counter() - started
+
+    def get_stats(self):
+        """Throughput of both stages, records per second of the time a stage was busy."""
+        return {
+            'failed_items': self.failed_items,
+            'fetched_records': self.fetched_records,
+            'fetch_records_per_second': self.fetched_records / self.fetch_seconds * self.max_workers if self.fetch_seconds else 0.0,
+            'fetch_blocked_seconds': self.fetch_blocked_seconds,
+            'written_records': self.written_records,
+            'write_records_per_second': self.written_records / self.write_seconds if self.write_seconds else 0.0,
+            'write_idle_seconds': self.write_idle_seconds,
+            'max_queue_depth': self.max_queue_depth,
+            'queue_size': self.queue_size,
+            'elapsed_seconds': self.elapsed_seconds,
+        }
@@ -1,105 +1,170 @@
 import networkx as nx
+import numpy as np
 from tqdm import tqdm
+import os
 import pickle
+import shutil
 from graph_tool.all import Graph
 
+from src.acquisition.graph_tool.graph_cache import GraphCache
+from src.acquisition.graph_tool.projection import (
+    ProjectionOptions, iter_edge_runs, iter_projection_edges, load_incidence, project_out_of_core
+)
+from src.acquisition.models.database_manager import to_epoch
+
 class ContributorGraphBuilder:
-    def __init__(self, db_manager, name, weighted=False):
+    def __init__(self, db_manager, name, weighted=False, start=None, end=None, engine='sparse',
+                 memory_budget=2 * 1024 ** 3, max_workers=None, work_dir="outputs/graphs/runs", options=None,
+                 cache=False):
+        """
+        Args:
+            db_manager: DatabaseManager to read the contributions from
+            name: Name of the main category
+            weighted: Weight the edges by the number of revisions on the shared pages
+            start: Optional start of a time window, only revisions from then on count, inclusive
+            end: Optional end of the time window, exclusive
+            engine: 'sparse' computes the edges as sparse matrix product B·Bᵀ of the contributor x page
+                incidence matrix in SciPy, 'sql' with one aggregate query in SQLite. 'out-of-core' computes
+                the product block by block in a process pool and writes the edges to disk first, for
+                categories whose edge list does not fit into memory. All give the same graph.
+            memory_budget: Bytes the 'out-of-core' workers may use together
+            max_workers: Number of 'out-of-core' worker processes, by default the number of CPUs
+            work_dir: Directory in which 'out-of-core' writes the edge runs to a new subdirectory, removed after the build
+            options: Optional ProjectionOptions to thin out hub pages, weight edges by Newman's 1/(k-1)
+                or keep only a backbone, computed by the 'sparse' and 'out-of-core' engines
+            cache: Optional GraphCache, build() then returns the graph and its projection report from the
+                cache while the category, the options and the database contents are unchanged. True uses a
+                GraphCache in outputs/graphs/cache
+        """
+        if engine not in ('sparse', 'sql', 'out-of-core'):
+            raise ValueError(f"engine must be 'sparse', 'sql' or 'out-of-core', not '{engine}'")
+        self.options = options or ProjectionOptions()
+        if engine == 'sql' and not self.options.is_default():
+            raise ValueError("Projection options need the 'sparse' or 'out-of-core' engine")
         self.db_manager = db_manager
         self.main_category_id = db_manager.get_main_category_by_name(name)
+        if self.main_category_id is None:
+            raise ValueError(f"Unknown main category '{name}', crawl it before building its graph")
         self.graph = Graph(directed=False)
 
         self.node_ids = self.graph.new_vertex_property("int")
         self.graph.vertex_properties["id"] = self.node_ids
 
         self.name = name
+        self.start = start
+        self.end = end
+        self.engine = engine
+        self.memory_budget = memory_budget
+        self.max_workers = max_workers
+        self.work_dir = work_dir
+        self.projection_stats = None
+        self.projection_report = {}
+        self.cache = GraphCache() if cache is True else cache or None
 
         self.weighted = weighted
         if weighted:
-            self.edge_weights = self.graph.new_edge_property("int")
+            self.edge_weights = self.graph.new_edge_property("double" if self.options.weighting == 'newman' else "int")
             self.graph.edge_properties["weight"] = self.edge_weights
 
     def fetch_contributors(self):
-        contributors = self.db_manager.get_all_contributors(main_category_id=self.main_category_id)
-        print(f"Total contributors: {len(contributors)}")
-        return contributors
-
-    def add_nodes(self, contributors):
-        for contributor in contributors:
-            v = self.graph.add_vertex()
-            self.node_ids[v] = contributor.id 
-
-    def add_edges(self, contributors):
-        total = len(contributors)
-        total_edges_added = 0
-        max_edges_for_one = 0
-        contributor_with_most = None
-        
-        # Create a lookup dictionary for faster vertex finding
-        vertex_lookup = {}
-        for v in self.graph.vertices():
-            vertex_lookup[self.node_ids[v]] = v
-        
-        with tqdm(total=total, desc="Adding edges", unit=" contributors") as pbar:
-            for contributor in contributors:
-                try:
-                    if self.weighted:
-                        co_contributors = self.db_manager.get_co_contributors_weighted(
-                            contributor.id, 
-                            self.main_category_id
-                        )
-                    else:
-                        co_contributors = self.db_manager.get_co_contributors(
-                            contributor.id, 
-                            self.main_category_id
-                        )
-                        
-                    edges_added_this_contributor = 0
-                    contributor_vertex = vertex_lookup[contributor.id]
-                    
-                    # Batch process co-contributors
-                    if self.weighted:
-                        for co_contributor_id, weight in co_contributors.items():
-                            if co_contributor_id in vertex_lookup:
-                                co_contributor_vertex = vertex_lookup[co_contributor_id]
-                                edge = self.graph.edge(contributor_vertex, co_contributor_vertex)
-                                
-                                if not edge:
-                                    edge = self.graph.add_edge(contributor_vertex, co_contributor_vertex)
-                                    self.edge_weights[edge] = weight
-                                    edges_added_this_contributor += 1
-                                    total_edges_added += 1
-                                else:
-                                    # Update weight if new weight is higher
-                                    self.edge_weights[edge] = max(self.edge_weights[edge], weight)
-                    else:
-                        for co_contributor_id in co_contributors:
-                            if co_contributor_id in vertex_lookup:
-                                co_contributor_vertex = vertex_lookup[co_contributor_id]
-                                if not self.graph.edge(contributor_vertex, co_contributor_vertex):
-                                    self.graph.add_edge(contributor_vertex, co_contributor_vertex)
-                                    edges_added_this_contributor += 1
-                                    total_edges_added += 1
-                    
-                    if edges_added_this_contributor > max_edges_for_one:
-                        max_edges_for_one = edges_added_this_contributor
-                        contributor_with_most = contributor.id
-                    
-                    pbar.update(1)
-                    
-                except Exception as e:
-                    print(f"\nError processing contributor {contributor.id}: {str(e)}")
-                    continue
-        
+        # The ids are streamed in chunks from a single query, no contributor objects are created
+        chunks = self.db_manager.iter_contributors(
+            main_category_id=self.main_category_id, start=self.start, end=self.end, as_numpy=True
+        )
+        contributor_ids = np.concatenate([chunk[:, 0] for chunk in chunks] or [np.empty(0, dtype=np.int64)])
+        print(f"Total contributors: {len(contributor_ids)}")
+        return contributor_ids
+
+    def add_nodes(self, contributor_ids):
+        self.graph.add_vertex(len(contributor_ids))
+        self.node_ids.a[:] = contributor_ids
+
+    def iter_sql_edges(self, contributor_ids):
+        # Vertex index of every contributor id, the vertices were added in the order of contributor_ids
+        vertex_index = np.full(contributor_ids.max() + 1 if len(contributor_ids) else 1, -1, dtype=np.int64)
+        vertex_index[contributor_ids] = np.arange(len(contributor_ids))
+
+        # The whole edge list comes from one aggregate query, each pair exactly once
+        edge_chunks = self.db_manager.iter_co_contribution_edges(
+            self.main_category_id, weighted=self.weighted, start=self.start, end=self.end
+        )
+        for edges in edge_chunks:
+            edges[:, :2] = vertex_index[edges[:, :2]]
+            yield edges
+
+    def add_edges(self, edge_chunks):
+        """Add chunks of (source vertex, target vertex[, weight]) rows to the graph in bulk."""
+        total = self.graph.num_vertices()
+        with tqdm(desc="Adding edges", unit=" edges") as pbar:
+            for edges in edge_chunks:
+                if self.weighted:
+                    self.graph.add_edge_list(edges, eprops=[self.edge_weights])
+                else:
+                    self.graph.add_edge_list(edges)
+                pbar.update(len(edges))
+
+        total_edges_added = self.graph.num_edges()
+        degrees = self.graph.get_out_degrees(self.graph.get_vertices())
+        most = int(np.argmax(degrees)) if total else None
+
         print(f"\nDetailed Edge Statistics:")
         print(f"Total edges added: {total_edges_added}")
-        print(f"Maximum edges for one contributor: {max_edges_for_one} (Contributor ID: {contributor_with_most})")
-        print(f"Average edges per contributor: {total_edges_added/total:.2f}")
+        if most is not None:
+            print(f"Maximum edges for one contributor: {degrees[most]} (Contributor ID: {self.node_ids.a[most]})")
+        if total:
+            print(f"Average edges per contributor: {total_edges_added/total:.2f}")
     
+    def cache_key_parts(self):
+        """Everything the graph depends on, the engine does not matter since all give the same graph."""
+        return {
+            'main_category_id': self.main_category_id.id,
+            'main_category': self.name,
+            'weighted': self.weighted,
+            'start': to_epoch(self.start),
+            'end': to_epoch(self.end),
+            'options': self.options.as_dict(),
+            'database': self.db_manager.get_content_fingerprint(self.main_category_id),
+        }
+
+    def use_graph(self, graph):
+        """Take over a graph built earlier, with the vertex and edge properties of build()."""
+        self.graph = graph
+        self.node_ids = graph.vertex_properties["id"]
+        if self.weighted:
+            self.edge_weights = graph.edge_properties["weight"]
+
     def build(self):
-        contributors = self.fetch_contributors()
-        self.add_nodes(contributors)
-        self.add_edges(contributors)
+        """Build the graph, or load it from the cache if it was built before from the same data, and return it."""
+        if self.cache is not None:
+            cache_parts = self.cache_key_parts()
+            cache_key = self.cache.key(cache_parts)
+            graph = self.cache.load(cache_key)
+            if graph is not None:
+                self.use_graph(graph)
+                self.projection_report = self.cache.load_report(cache_key)
+                print(f"Loaded cached graph {cache_key[:12]} ({graph.num_vertices()} vertices, {graph.num_edges()} edges)")
+                return self.graph
+
+        if self.engine in ('sparse', 'out-of-core'):
+            # The rows of the incidence matrix are the contributor ids in ascending order, like fetch_contributors
+            contributor_ids, incidence = load_incidence(self.db_manager, self.main_category_id, self.start, self.end)
+            print(f"Total contributors: {len(contributor_ids)}")
+            self.add_nodes(contributor_ids)
+            if self.engine == 'sparse':
+                self.add_edges(iter_projection_edges(incidence, weighted=self.weighted, options=self.options,
+                                                     report=self.projection_report))
+            else:
+                self.projection_stats = project_out_of_core(incidence, self.work_dir, weighted=self.weighted,
+                                                            memory_budget=self.memory_budget, max_workers=self.max_workers,
+                                                            options=self.options)
+                self.projection_report = self.projection_stats['report']
+                self.add_edges(iter_edge_runs(self.projection_stats['directory']))
+                # Only the subdirectory of this build is removed, work_dir itself is left alone
+                shutil.rmtree(self.projection_stats['directory'], ignore_errors=True)
+        else:
+            contributor_ids = self.fetch_contributors()
+            self.add_nodes(contributor_ids)
+            self.add_edges(self.iter_sql_edges(contributor_ids))
 
         # Print sanity check statistics
         num_vertices = self.graph.num_vertices()
@@ -109,9 +174,21 @@ class ContributorGraphBuilder:
         print(f"Number of edges (collaborations): {num_edges}")
         
         file_name = self.name.replace(" ", "_")
-        self.save_as_gt(file_name)
+        graph_file = self.save_as_gt(file_name)
+        if self.cache is not None:
+            self.cache.save(cache_key, graph_file, cache_parts, self.projection_report)
+        return self.graph
         
     def save_as_gt(self, name):
         weighted_suffix = "-weighted" if self.weighted else ""
-        self.graph.save(f"outputs/graphs/{name}{weighted_suffix}.gt", fmt="gt")
-        print(f"Graph saved as {name}{weighted_suffix}.gt")
+        window_suffix = ""
+        if self.start is not None or self.end is not None:
+            bounds = ['' if bound is None else to_epoch(bound) for bound in (self.start, self.end)]
+            window_suffix = f"-{bounds[0]}-{bounds[1]}"
+        file_name = f"{name}{weighted_suffix}{window_suffix}{self.options.file_suffix()}.gt"
+        path = f"outputs/graphs/{file_name}"
+        # Saved under a temporary name and moved over the old file, a cached graph linked to it stays intact
+        self.graph.save(f"{path}.tmp", fmt="gt")
+        os.replace(f"{path}.tmp", path)
+        print(f"Graph saved as {file_name}")
+        return path
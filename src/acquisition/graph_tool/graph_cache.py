@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from graph_tool.all import load_graph
+
+# Part of every key, increase it when the graphs of an unchanged key would come out differently
+CACHE_VERSION = 1
+
+
+class GraphCache:
+    def __init__(self, directory="outputs/graphs/cache", max_bytes=5 * 1024 ** 3):
+        """
+        Content-addressed cache of built graphs: each graph is stored as <key>.gt next to a <key>.json
+        with the parts of its key and the projection report. The .gt file is a hard link to the graph
+        file saved by the builder, so caching takes no extra space as long as both are on the same file
+        system. When the .gt files together exceed max_bytes, the least recently used ones are removed;
+        the time of use is kept on the .json, since touching the .gt would touch the builder's file too.
+
+        Args:
+            directory: Directory of the cached graphs
+            max_bytes: Size limit of the cached graphs together
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, parts):
+        """SHA-256 of the parts of a key, a dict of JSON serializable values, independent of their order."""
+        payload = json.dumps({'version': CACHE_VERSION, **parts}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.gt")
+
+    def metadata_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """The cached graph of a key or None, marks the graph as recently used."""
+        file_name = self.path(key)
+        if not os.path.exists(file_name):
+            return None
+        if os.path.exists(self.metadata_path(key)):
+            os.utime(self.metadata_path(key))
+        return load_graph(file_name)
+
+    def load_report(self, key):
+        """The projection report stored with the graph of a key, empty if there is none."""
+        file_name = self.metadata_path(key)
+        if not os.path.exists(file_name):
+            return {}
+        with open(file_name) as file:
+            return json.load(file).get('projection_report', {})
+
+    def save(self, key, graph_file, parts=None, report=None):
+        """
+        Store a saved graph under a key and evict the least recently used graphs beyond max_bytes.
+
+        Args:
+            key: Key from key()
+            graph_file: .gt file of the graph. It must be replaced, not rewritten in place, when it is
+                saved again, otherwise the cached graph changes with it
+            parts: Optional parts of the key, saved as <key>.json to see what a cached graph contains
+            report: Optional projection report, returned by load_report() with the cached graph
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = self.path(key)
+        # Linked under a temporary name first, so a crash never leaves a truncated graph under a valid key
+        if os.path.exists(f"{file_name}.tmp"):
+            os.remove(f"{file_name}.tmp")
+        try:
+            os.link(graph_file, f"{file_name}.tmp")
+        except OSError:
+            # Other file system, or one without hard links
+            shutil.copyfile(graph_file, f"{file_name}.tmp")
+        os.replace(f"{file_name}.tmp", file_name)
+        with open(self.metadata_path(key), 'w') as file:
+            metadata = {**(parts or {}), 'projection_report': report or {}, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            json.dump(metadata, file, indent=2, default=_to_json)
+        self.evict(keep=key)
+        return file_name
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used graphs until the rest fit into max_bytes, returns the removed keys.
+        A graph counts with its full size even if the builder's file links to it as well.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.gt'):
+                key = file_name[:-len('.gt')]
+                size = os.stat(self.path(key)).st_size
+                # Last use is the time of the .json, entries without one count as the oldest
+                used = os.stat(self.metadata_path(key)).st_mtime if os.path.exists(self.metadata_path(key)) else 0
+                entries.append((used, size, key))
+        total = sum(size for _, size, _ in entries)
+
+        removed = []
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for suffix in ('.gt', '.json'):
+                if os.path.exists(os.path.join(self.directory, f"{key}{suffix}")):
+                    os.remove(os.path.join(self.directory, f"{key}{suffix}"))
+            total -= size
+            removed.append(key)
+        if removed:
+            print(f"Evicted {len(removed)} cached graphs, {total / 1024 ** 2:.1f} MB left in {self.directory}")
+        return removed
+
+
+def _to_json(value):
+    """NumPy scalars in the report become plain numbers, anything else its string."""
+    return value.item() if hasattr(value, 'item') else str(value)
@@ -0,0 +1,496 @@
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy import sparse
+from scipy.stats import hypergeom
+
+# Peak memory of project_block per estimated pair of its block, measured on "Machine learning"
+BYTES_PER_PAIR = {False: 40, True: 56}
+RUN_FILE = 'run_{:05d}.npy'
+
+_worker_incidence = None
+_worker_options = None
+_worker_context = None
+
+
+class ProjectionOptions:
+    """
+    Options of the sparse projection that thin out hub pages, change the edge weights or keep only a backbone.
+
+    A page with k contributors adds k(k-1)/2 pairs, so a few pages with many contributors dominate
+    the edges. They can be dropped above a number of contributors, or a random sample of their
+    contributors can be kept so that no page adds more than a number of pairs.
+    """
+    WEIGHTINGS = ('revisions', 'newman')
+    BACKBONES = (None, 'disparity', 'hypergeometric')
+
+    def __init__(self, max_page_contributors=None, max_pairs_per_page=None, weighting='revisions',
+                 backbone=None, alpha=0.05, seed=0):
+        """
+        Args:
+            max_page_contributors: Drop pages with more contributors than this
+            max_pairs_per_page: Keep a random sample of the contributors of a page so it adds at most this many pairs
+            weighting: 'revisions' weights an edge by the larger of the revisions either contributor made on
+                the shared pages, 'newman' by the sum of 1/(k-1) over the shared pages with k contributors
+            backbone: Keep only the significant edges, 'disparity' with the disparity filter of Serrano et al.
+                on the weights, 'hypergeometric' if the number of shared pages is unlikely under random editing
+            alpha: Significance level of the backbone
+            seed: Seed of the sampling of max_pairs_per_page
+        """
+        if weighting not in self.WEIGHTINGS:
+            raise ValueError(f"weighting must be one of {self.WEIGHTINGS}, not '{weighting}'")
+        if backbone not in self.BACKBONES:
+            raise ValueError(f"backbone must be one of {self.BACKBONES}, not '{backbone}'")
+        if max_pairs_per_page is not None and max_pairs_per_page < 1:
+            raise ValueError('max_pairs_per_page must be at least 1')
+        self.max_page_contributors = max_page_contributors
+        self.max_pairs_per_page = max_pairs_per_page
+        self.weighting = weighting
+        self.backbone = backbone
+        self.alpha = alpha
+        self.seed = seed
+
+    def as_dict(self):
+        return {
+            'max_page_contributors': self.max_page_contributors,
+            'max_pairs_per_page': self.max_pairs_per_page,
+            'weighting': self.weighting,
+            'backbone': self.backbone,
+            'alpha': self.alpha,
+            'seed': self.seed,
+        }
+
+    def is_default(self):
+        return self.as_dict() == ProjectionOptions().as_dict()
+
+    def file_suffix(self):
+        """Suffix for the file name of a graph built with these options, empty for the defaults."""
+        parts = []
+        if self.max_page_contributors is not None:
+            parts.append(f'max{self.max_page_contributors}contributors')
+        if self.max_pairs_per_page is not None:
+            parts.append(f'max{self.max_pairs_per_page}pairs-seed{self.seed}')
+        if self.weighting != 'revisions':
+            parts.append(self.weighting)
+        if self.backbone is not None:
+            parts.append(f'{self.backbone}{self.alpha}')
+        return ''.join(f'-{part}' for part in parts)
+
+    def __repr__(self):
+        return f"ProjectionOptions({', '.join(f'{key}={value!r}' for key, value in self.as_dict().items())})"
+
+
+def load_incidence(db_manager, main_category_id, start=None, end=None):
+    """
+    Load the contributor x page incidence matrix of a main category.
+
+    Args:
+        db_manager: DatabaseManager to read from
+        main_category_id: ID of the main category
+        start: Optional start of a time window, only revisions from then on count, inclusive
+        end: Optional end of the time window, exclusive
+
+    Returns:
+        Tuple (contributor_ids, incidence): the sorted contributor ids and a CSR matrix with one
+        row per contributor id and one column per page, holding the number of revisions
+    """
+    chunks = list(db_manager.iter_incidence(main_category_id, start=start, end=end, as_numpy=True))
+    rows = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+    contributor_ids, contributor_index = np.unique(rows[:, 0], return_inverse=True)
+    page_ids, page_index = np.unique(rows[:, 1], return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (rows[:, 2].astype(np.int32), (contributor_index, page_index)),
+        shape=(len(contributor_ids), len(page_ids)),
+    )
+    return contributor_ids, incidence
+
+
+def iter_projection_edges(incidence, weighted=False, max_block_pairs=20000000, options=None, report=None):
+    """
+    Stream the co-contribution edges of the projection B·Bᵀ of an incidence matrix B.
+
+    The product is computed for blocks of rows, each block sized so that it holds at most about
+    max_block_pairs contributor pairs, and only its upper triangle is kept, so every pair appears
+    once with the smaller row first, ordered like the edges of the SQL query. By default the weight
+    is the one of DatabaseManager.iter_co_contribution_edges: the larger of the revisions either
+    contributor made on the pages both edited.
+
+    Args:
+        incidence: CSR matrix contributors x pages with the number of revisions
+        weighted: Include the weight as third column
+        max_block_pairs: Upper bound for the pairs computed at once, bounds the memory
+        options: Optional ProjectionOptions
+        report: Optional dictionary that is filled with how much the options shrink the graph
+
+    Yields:
+        int64 numpy arrays of shape (n, 2) with row indices of the incidence matrix, (n, 3) if weighted,
+        float64 if weighted with the 'newman' weighting
+    """
+    options = options or ProjectionOptions()
+    report = {} if report is None else report
+    incidence, context = prepare_projection(incidence, options, report)
+    blocks = plan_blocks(incidence, max_block_pairs)
+    if options.backbone == 'disparity':
+        context['strengths'], context['degrees'] = _zero_strengths(incidence)
+        for first, last in blocks:
+            _add_strengths(context, *block_strengths(incidence, first, last, options, context))
+
+    report['edges_before_backbone'] = report['edges'] = 0
+    for first, last in blocks:
+        edges, candidates = project_block(incidence, first, last, weighted, options, context)
+        report['edges_before_backbone'] += candidates
+        report['edges'] += len(edges)
+        if len(edges):
+            yield edges
+    _print_backbone_report(options, report)
+
+
+def prepare_projection(incidence, options, report=None):
+    """
+    Apply the page options to the incidence matrix and precompute what the blocks need.
+
+    Args:
+        incidence: CSR matrix contributors x pages with the number of revisions
+        options: ProjectionOptions
+        report: Optional dictionary that is filled with the candidate pairs before and after the page options
+
+    Returns:
+        Tuple (incidence, context): the thinned incidence matrix with the same shape and a dictionary
+        with the page weights of the Newman weighting and the degrees of the hypergeometric backbone
+    """
+    report = {} if report is None else report
+    context = {}
+    contributors_per_page = np.diff(incidence.tocsc().indptr)
+    report['pairs'] = report['pairs_before_page_options'] = _pairs(contributors_per_page)
+
+    if options.max_page_contributors is not None:
+        keep = (contributors_per_page <= options.max_page_contributors).astype(incidence.dtype)
+        incidence = (incidence @ sparse.diags(keep, dtype=incidence.dtype)).tocsr()
+        incidence.eliminate_zeros()
+        report['dropped_pages'] = int((keep == 0).sum())
+        report['pairs'] = _pairs(np.diff(incidence.tocsc().indptr))
+        print(f"Dropped {report['dropped_pages']} pages with more than {options.max_page_contributors} contributors: "
+              f"{_shrink(report['pairs_before_page_options'], report['pairs'])} candidate pairs")
+
+    if options.weighting == 'newman':
+        # Weights from the contributors of a page before sampling, a page with one contributor adds no pairs
+        contributors_per_page = np.diff(incidence.tocsc().indptr)
+        context['page_weights'] = np.divide(1.0, contributors_per_page - 1, out=np.zeros(len(contributors_per_page)),
+                                            where=contributors_per_page > 1)
+
+    if options.max_pairs_per_page is not None:
+        pairs_before = report['pairs']
+        incidence, report['sampled_pages'] = _sample_contributors(incidence, options.max_pairs_per_page, options.seed)
+        report['pairs'] = _pairs(np.diff(incidence.tocsc().indptr))
+        print(f"Sampled the contributors of {report['sampled_pages']} pages down to at most {options.max_pairs_per_page} "
+              f"pairs each: {_shrink(pairs_before, report['pairs'])} candidate pairs")
+
+    if options.backbone == 'hypergeometric':
+        context['pages_per_contributor'] = np.diff(incidence.indptr)
+        context['pages'] = int((np.diff(incidence.tocsc().indptr) > 0).sum())
+    return incidence, context
+
+
+def plan_blocks(incidence, max_block_pairs):
+    """
+    Split the rows of an incidence matrix into consecutive blocks of at most about max_block_pairs pairs.
+
+    Returns:
+        List of (first, last) row ranges, a row with more pairs than that gets a block of its own
+    """
+    edited = _edited(incidence)
+    # Upper bound of the pairs of every row: the contributors of all its pages, duplicates included
+    pairs_per_row = edited @ np.diff(edited.T.tocsr().indptr)
+    bounds = np.searchsorted(np.cumsum(pairs_per_row), np.arange(max_block_pairs, pairs_per_row.sum(), max_block_pairs))
+    blocks = np.unique(np.concatenate(([0], bounds + 1, [incidence.shape[0]])))
+    return [(int(first), int(last)) for first, last in zip(blocks[:-1], blocks[1:])]
+
+
+def project_block(incidence, first, last, weighted=False, options=None, context=None):
+    """
+    Edges of the upper triangle of B·Bᵀ whose smaller row lies in [first, last), sorted by rows.
+
+    Args:
+        incidence: CSR matrix contributors x pages, prepared by prepare_projection if options are given
+        first: First row of the block
+        last: Row after the last row of the block
+        weighted: Include the weight as third column
+        options: Optional ProjectionOptions
+        context: Dictionary from prepare_projection, with the node strengths for the disparity backbone
+
+    Returns:
+        Tuple (edges, candidates): array of shape (n, 2), (n, 3) if weighted, and the number of
+        edges before the backbone
+    """
+    options = options or ProjectionOptions()
+    rows, cols, weights, shared_pages = _block_pairs(incidence, first, last, options, context,
+                                                     weights=weighted or options.backbone == 'disparity',
+                                                     counts=options.backbone == 'hypergeometric')
+    candidates = len(rows)
+
+    if options.backbone == 'hypergeometric':
+        # Probability to share at least that many pages if both contributors edited their pages at random
+        degrees = context['pages_per_contributor']
+        keep = _hypergeometric_pvalues(shared_pages, degrees[rows], degrees[cols], context['pages']) < options.alpha
+    elif options.backbone == 'disparity':
+        strengths, degrees = context['strengths'], context['degrees']
+        keep = np.minimum(
+            _disparity(weights, strengths[rows], degrees[rows]),
+            _disparity(weights, strengths[cols], degrees[cols]),
+        ) < options.alpha
+    else:
+        keep = slice(None)
+
+    columns = [rows[keep], cols[keep]]
+    if weighted:
+        columns.append(weights[keep])
+    return np.column_stack(columns) if columns[0].size else np.empty((0, len(columns)), dtype=np.int64), candidates
+
+
+def block_strengths(incidence, first, last, options, context):
+    """Weighted degree and degree of every row from the edges of one block, for the disparity backbone."""
+    rows, cols, weights, _ = _block_pairs(incidence, first, last, options, context, weights=True, counts=False)
+    size = incidence.shape[0]
+    strengths = np.bincount(rows, weights, minlength=size) + np.bincount(cols, weights, minlength=size)
+    degrees = np.bincount(rows, minlength=size) + np.bincount(cols, minlength=size)
+    return strengths, degrees
+
+
+def project_out_of_core(incidence, directory, weighted=False, memory_budget=2 * 1024 ** 3, max_workers=None,
+                        options=None):
+    """
+    Compute the projection B·Bᵀ block by block in a process pool and write the edges to disk.
+
+    Every block covers a range of rows, so the blocks hold disjoint sets of pairs and each one is
+    written as a sorted run of edges. Read in block order, the runs form the complete edge list
+    sorted like the one of iter_projection_edges, see iter_edge_runs. The memory budget is shared by
+    the workers, each block is sized to fit into the part of one worker. Every block reports the peak
+    of the memory it allocated itself, which can be checked against that part.
+
+    Args:
+        incidence: CSR matrix contributors x pages with the number of revisions
+        directory: Directory in which a new subdirectory for the runs is created, nothing else in it is touched
+        weighted: Include the weight as third column
+        memory_budget: Bytes the workers may use together for the products
+        max_workers: Number of worker processes, by default the number of CPUs
+        options: Optional ProjectionOptions
+
+    Returns:
+        Dictionary with the directory of the runs, the number of edges, the seconds, the peak RSS in MB
+        of the largest process, a list with rows, edges, seconds and peak allocation in MB of every block
+        and the report of the options. The caller removes the directory of the runs once it has read them.
+    """
+    options = options or ProjectionOptions()
+    report = {}
+    incidence, context = prepare_projection(incidence, options, report)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_block_pairs = max(1, memory_budget // max_workers // _bytes_per_pair(weighted, options))
+    blocks = plan_blocks(incidence, max_block_pairs)
+    os.makedirs(directory, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix='projection-', dir=directory)
+
+    start = time.perf_counter()
+    if options.backbone == 'disparity':
+        # The disparity filter needs the strength of every node, a first pass over all blocks sums them up
+        context['strengths'], context['degrees'] = _zero_strengths(incidence)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(incidence, options, context)) as executor:
+            for future in as_completed([executor.submit(_block_strengths, first, last) for first, last in blocks]):
+                _add_strengths(context, *future.result())
+
+    block_stats = [None] * len(blocks)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(incidence, options, context)) as executor:
+        futures = {
+            executor.submit(_project_block_to_run, directory, idx, first, last, weighted): idx
+            for idx, (first, last) in enumerate(blocks)
+        }
+        for future in as_completed(futures):
+            stats = future.result()
+            block_stats[futures[future]] = stats
+            print(f"Block {futures[future] + 1}/{len(blocks)}: {stats['rows']} contributors, {stats['edges']} edges "
+                  f"in {stats['seconds']:.2f}s, {stats['peak_mb']:.0f} MB allocated at peak")
+
+    report['edges_before_backbone'] = sum(stats['candidates'] for stats in block_stats)
+    report['edges'] = sum(stats['edges'] for stats in block_stats)
+    result = {
+        'directory': directory,
+        'edges': report['edges'],
+        'seconds': time.perf_counter() - start,
+        'peak_rss_mb': max([_peak_rss_mb()] + [stats['process_peak_rss_mb'] for stats in block_stats]),
+        'blocks': block_stats,
+        'report': report,
+    }
+    print(f"Projected {result['edges']} edges in {len(blocks)} blocks in {result['seconds']:.2f}s, "
+          f"process peak RSS {result['peak_rss_mb']:.0f} MB")
+    _print_backbone_report(options, report)
+    return result
+
+
+def iter_edge_runs(directory, chunk_size=1000000):
+    """
+    Stream the edge list written by project_out_of_core, run after run.
+
+    The runs are memory-mapped, so at most one chunk of edges is in memory at a time.
+
+    Args:
+        directory: Directory of the runs
+        chunk_size: Number of edges per yielded chunk
+
+    Yields:
+        int64 numpy arrays of shape (n, 2), (n, 3) if weighted
+    """
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.startswith('run_'):
+            continue
+        run = np.load(os.path.join(directory, file_name), mmap_mode='r')
+        for offset in range(0, len(run), chunk_size):
+            yield np.array(run[offset:offset + chunk_size])
+
+
+def _init_worker(incidence, options, context):
+    global _worker_incidence, _worker_options, _worker_context
+    _worker_incidence, _worker_options, _worker_context = incidence, options, context
+
+
+def _block_strengths(first, last):
+    return block_strengths(_worker_incidence, first, last, _worker_options, _worker_context)
+
+
+def _project_block_to_run(directory, idx, first, last, weighted):
+    start = time.perf_counter()
+    # NumPy reports its buffers to tracemalloc, so this is the memory of this block alone. The RSS
+    # of the worker is not, the pool reuses the process and ru_maxrss only ever grows.
+    tracemalloc.start()
+    try:
+        edges, candidates = project_block(_worker_incidence, first, last, weighted, _worker_options, _worker_context)
+        np.save(os.path.join(directory, RUN_FILE.format(idx)), edges)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'rows': last - first,
+        'candidates': candidates,
+        'edges': len(edges),
+        'seconds': time.perf_counter() - start,
+        'peak_mb': peak / 1024 ** 2,
+        'process_peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _peak_rss_mb():
+    """Peak RSS of the whole process so far, ru_maxrss is in KiB on Linux."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _edited(incidence):
+    """Binary version of the incidence matrix: whether a contributor edited a page at all."""
+    edited = incidence.copy()
+    edited.data = np.ones_like(edited.data)
+    return edited
+
+
+def _block_pairs(incidence, first, last, options, context, weights, counts):
+    """Rows, columns, weights and number of shared pages of the upper triangle pairs of a block."""
+    edited = _edited(incidence)
+    # Only the columns from the first row of the block on can hold pairs of the upper triangle
+    others_edited = edited[first:].T.tocsr()
+    block_edited = edited[first:last]
+    products = {}
+    if weights and options.weighting == 'revisions':
+        products['weights'] = incidence[first:last] @ others_edited
+        # Revisions of the other contributors on the pages of the block rows, same sparsity pattern
+        reverse = block_edited @ incidence[first:].T.tocsr()
+        reverse.sort_indices()
+    elif weights:
+        products['weights'] = (block_edited @ sparse.diags(context['page_weights'])) @ others_edited
+    if counts or not weights:
+        products['counts'] = block_edited @ others_edited
+    for product in products.values():
+        product.sort_indices()
+    if 'weights' in products and options.weighting == 'revisions':
+        np.maximum(products['weights'].data, reverse.data, out=products['weights'].data)
+
+    # All products share the sparsity pattern: a pair is nonzero exactly if it shares a page
+    pattern = next(iter(products.values()))
+    rows = np.repeat(np.arange(first, last, dtype=np.int64), np.diff(pattern.indptr))
+    cols = pattern.indices.astype(np.int64) + first
+    upper = cols > rows
+    values = {name: product.data[upper] for name, product in products.items()}
+    if 'weights' in values and options.weighting == 'revisions':
+        values['weights'] = values['weights'].astype(np.int64)
+    return rows[upper], cols[upper], values.get('weights'), values.get('counts')
+
+
+def _sample_contributors(incidence, max_pairs, seed):
+    """Keep a random sample of the contributors of every page so that it adds at most max_pairs pairs."""
+    # Largest number of contributors m with m(m-1)/2 <= max_pairs
+    keep_contributors = int((1 + np.sqrt(1 + 8 * max_pairs)) // 2)
+    by_page = incidence.tocsc()
+    by_page.sort_indices()
+    pages = np.repeat(np.arange(by_page.shape[1]), np.diff(by_page.indptr))
+    # Random rank of every contributor within its page
+    order = np.lexsort((np.random.default_rng(seed).random(by_page.nnz), pages))
+    ranks = np.empty(by_page.nnz, dtype=np.int64)
+    ranks[order] = np.arange(by_page.nnz) - by_page.indptr[pages[order]]
+    keep = ranks < keep_contributors
+    sampled_pages = int((np.diff(by_page.indptr) > keep_contributors).sum())
+    sampled = sparse.csc_matrix((by_page.data[keep], by_page.indices[keep], np.r_[0, np.cumsum(np.bincount(pages[keep], minlength=by_page.shape[1]))]),
+                                shape=by_page.shape)
+    return sampled.tocsr(), sampled_pages
+
+
+def _hypergeometric_pvalues(shared_pages, degrees, other_degrees, pages):
+    """P(X >= shared_pages) for X ~ Hypergeom(pages, degree, other degree), computed once per distinct triple."""
+    # The distribution is symmetric in the two degrees, and most contributors edit only a few pages
+    triple = [shared_pages.astype(np.int64), np.minimum(degrees, other_degrees).astype(np.int64),
+              np.maximum(degrees, other_degrees).astype(np.int64)]
+    if pages < 2 ** 21:
+        # All three values are at most the number of pages, packed into one key they are found much faster
+        keys, inverse = np.unique((triple[0] << 42) | (triple[1] << 21) | triple[2], return_inverse=True)
+        unique = [keys >> 42, (keys >> 21) & (2 ** 21 - 1), keys & (2 ** 21 - 1)]
+    else:
+        rows, inverse = np.unique(np.column_stack(triple), axis=0, return_inverse=True)
+        unique = rows.T
+    return hypergeom.sf(unique[0] - 1, pages, unique[1], unique[2])[inverse.ravel()]
+
+
+def _disparity(weights, strengths, degrees):
+    """Probability of an edge weight at least that large if the strength of the node were split at random."""
+    return (1 - weights / strengths) ** (degrees - 1)
+
+
+def _zero_strengths(incidence):
+    return np.zeros(incidence.shape[0]), np.zeros(incidence.shape[0], dtype=np.int64)
+
+
+def _add_strengths(context, strengths, degrees):
+    context['strengths'] += strengths
+    context['degrees'] += degrees
+
+
+def _pairs(contributors_per_page):
+    """Candidate pairs of all pages, duplicates of pairs sharing several pages included."""
+    contributors_per_page = contributors_per_page.astype(np.int64)
+    return int((contributors_per_page * (contributors_per_page - 1) // 2).sum())
+
+
+def _shrink(before, after):
+    return f"{before} -> {after} ({(1 - after / before) * 100 if before else 0:.1f}% fewer)"
+
+
+def _bytes_per_pair(weighted, options):
+    weights = weighted or options.backbone == 'disparity'
+    # A second product for the shared pages when both are needed
+    return BYTES_PER_PAIR[weights] + (16 if weights and options.backbone == 'hypergeometric' else 0)
+
+
+def _print_backbone_report(options, report):
+    if options.backbone is not None:
+        print(f"{options.backbone.capitalize()} backbone (alpha={options.alpha}): kept "
+              f"{_shrink(report['edges_before_backbone'], report['edges'])} edges")
@@ -0,0 +1,114 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Headers describing the transfer rather than the content, the cache stores decoded bodies
+TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+class CacheMiss(LookupError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+class RecordReplayAdapter(BaseAdapter):
+    """
+    Transport adapter that records API responses in a compressed on-disk cache and replays them.
+
+    Responses are stored as one gzipped JSON file per request, keyed by a hash of the method,
+    the URL with its sorted query parameters and the request body. In 'record' mode requests are
+    sent through the wrapped adapter and every successful response is stored. In 'replay' mode
+    requests are answered from the cache only, without any network access, and a request that
+    was not recorded raises CacheMiss. 'auto' replays what is cached and records the rest.
+    """
+
+    MODES = ('record', 'replay', 'auto')
+
+    def __init__(self, cache_dir, mode='replay', adapter=None):
+        """
+        Args:
+            cache_dir: Directory of the cache, created if it does not exist
+            mode: 'record', 'replay' or 'auto'
+            adapter: Adapter sending the requests that are recorded, by default a plain HTTPAdapter
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, not '{mode}'")
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.adapter = adapter or HTTPAdapter()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def send(self, request, **kwargs):
+        path = self._path(request)
+        if self.mode != 'record' and os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return self._load(path, request)
+
+        with self._lock:
+            self.misses += 1
+        if self.mode == 'replay':
+            raise CacheMiss(f'No recorded response for {request.method} {request.url}')
+
+        response = self.adapter.send(request, **kwargs)
+        if response.status_code == 200 and 'MediaWiki-API-Error' not in response.headers:
+            self._store(path, response)
+            with self._lock:
+                self.recorded += 1
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'recorded': self.recorded}
+
+    def _path(self, request):
+        url = urlsplit(request.url)
+        query = sorted(parse_qsl(url.query, keep_blank_values=True))
+        body = request.body.encode() if isinstance(request.body, str) else (request.body or b'')
+        key = json.dumps([request.method, f'{url.scheme}://{url.netloc}{url.path}', query], ensure_ascii=False)
+
+        digest = hashlib.sha256(key.encode() + b'\n' + body).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}.json.gz')
+
+    def _store(self, path, response):
+        entry = {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in TRANSFER_HEADERS},
+            'encoding': response.encoding,
+            'body': response.content.decode('utf-8'),
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first, so concurrent readers never see a partial entry
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _load(self, path, request):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            entry = json.load(f)
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = entry['encoding']
+        response._content = entry['body'].encode('utf-8')
+        response.url = request.url
+        response.request = request
+        return response
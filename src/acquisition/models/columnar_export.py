@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet support is optional, the .npy format needs only numpy
+    pa = None
+    pq = None
+
+# Column name -> dtype of the exported snapshot, timestamps are seconds since the epoch (UTC)
+COLUMNS = {
+    'revision_id': np.int64,
+    'page_id': np.int32,
+    'contributor_id': np.int32,
+    'timestamp': np.int32,
+}
+PARQUET_FILE = 'revisions.parquet'
+META_FILE = 'meta.json'
+
+
+def export_revisions(db_manager, main_category_id, directory, fmt='npy', chunk_size=100000):
+    """
+    Export the revisions of a main category as columnar snapshot, ordered by timestamp and revision id.
+
+    With fmt='npy' every column is written to its own .npy file, filled chunk by chunk
+    through a memory map, so the export needs no more memory than one chunk. With fmt='parquet'
+    (requires pyarrow) all columns go into one Parquet file.
+
+    Args:
+        db_manager: DatabaseManager to read from
+        main_category_id: ID of the main category
+        directory: Output directory, created if it does not exist
+        fmt: 'npy' or 'parquet'
+        chunk_size: Number of rows fetched from SQLite at once
+
+    Returns:
+        Number of exported revisions
+    """
+    if fmt not in ('npy', 'parquet'):
+        raise ValueError(f"fmt must be 'npy' or 'parquet', not '{fmt}'")
+    if fmt == 'parquet' and pq is None:
+        raise ImportError("Exporting to Parquet requires pyarrow, install it with 'pip install pyarrow'")
+
+    main_category_id = getattr(main_category_id, 'id', main_category_id)
+    os.makedirs(directory, exist_ok=True)
+
+    number_of_rows = db_manager.db.execute_sql(
+        'SELECT COUNT(*) FROM revision WHERE main_category_id = ?', (main_category_id,)
+    ).fetchone()[0]
+    # Ordered by (timestamp_epoch, id): the (main_category, timestamp_epoch, ...) index gives the time order,
+    # SQLite only sorts revisions with the same timestamp by id
+    chunks = db_manager.iter_revisions(main_category_id, chunk_size=chunk_size, as_numpy=True)
+
+    if fmt == 'npy':
+        arrays = {
+            name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(number_of_rows,))
+            for name, dtype in COLUMNS.items()
+        }
+        offset = 0
+        for chunk in chunks:
+            for idx, (name, array) in enumerate(arrays.items()):
+                array[offset:offset + len(chunk)] = chunk[:, idx]
+            offset += len(chunk)
+        for array in arrays.values():
+            array.flush()
+    else:
+        schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in COLUMNS.items()])
+        with pq.ParquetWriter(os.path.join(directory, PARQUET_FILE), schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.table(
+                    {name: chunk[:, idx].astype(dtype) for idx, (name, dtype) in enumerate(COLUMNS.items())},
+                    schema=schema,
+                ))
+
+    meta = {
+        'main_category_id': main_category_id,
+        'format': fmt,
+        'rows': number_of_rows,
+        'columns': {name: np.dtype(dtype).name for name, dtype in COLUMNS.items()},
+        'exported_at': datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(directory, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f'Exported {number_of_rows} revisions to {directory} ({fmt})')
+    return number_of_rows
+
+
+def load_revisions(directory, columns=None):
+    """
+    Load a columnar snapshot written by export_revisions without copying it.
+
+    .npy columns are memory-mapped read-only, so only the pages that are accessed are read
+    from disk. Parquet columns are read through a memory map and handed over zero-copy.
+
+    Args:
+        directory: Directory of the snapshot
+        columns: Optional list of the columns to load, by default all
+
+    Returns:
+        Dictionary column name -> numpy array
+    """
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    columns = columns or list(meta['columns'])
+
+    if meta['format'] == 'npy':
+        return {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in columns}
+
+    if pq is None:
+        raise ImportError("Loading a Parquet snapshot requires pyarrow, install it with 'pip install pyarrow'")
+    table = pq.read_table(os.path.join(directory, PARQUET_FILE), columns=columns, memory_map=True)
+    # A column written in several row groups is made contiguous once, after that the conversion is zero-copy
+    return {name: table.column(name).combine_chunks().to_numpy(zero_copy_only=True) for name in columns}
+
@@ -1,44 +1,336 @@
+import json
+import logging
+import re
+from datetime import datetime, timezone
+from time import perf_counter
 from peewee import SqliteDatabase
-from peewee import fn
-from src.acquisition.models.models import Page, Contributor, Revision, MainCategory, Crawls
+from peewee import fn, chunked, JOIN
+from playhouse.migrate import SqliteMigrator, migrate
+from src.acquisition.models.models import Page, Contributor, Revision, MainCategory, Crawls, CategoryLink, CrawlCategory, CrawlPage, PageContributor, ActivityMonth, ActivityMonthPage, ActivityMonthContributor
+from src.acquisition.models.lru_cache import LRUCache
+import numpy as np
 import pandas as pd
 
+# Lowest limit on bound parameters per statement across SQLite versions, multi-row inserts are split accordingly
+SQLITE_MAX_VARIABLES = 999
+# SQL for the first month ('YYYY-MM') of the period containing {month}
+PERIOD_STARTS = {
+    'month': "{month}",
+    'quarter': "substr({month}, 1, 5) || printf('%02d', (CAST(substr({month}, 6, 2) AS INTEGER) - 1) / 3 * 3 + 1)",
+    'year': "substr({month}, 1, 4) || '-01'",
+}
+
+def to_epoch(value):
+    """Seconds since the epoch of a datetime, date, ISO 8601 string or number, naive values are taken as UTC."""
+    if value is None or isinstance(value, (int, float)):
+        return None if value is None else int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def time_window(start=None, end=None, column='timestamp_epoch'):
+    """SQL condition and parameters restricting column to [start, end), each bound optional."""
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f'{column} >= ?')
+        params.append(to_epoch(start))
+    if end is not None:
+        conditions.append(f'{column} < ?')
+        params.append(to_epoch(end))
+    return ''.join(f' AND {condition}' for condition in conditions), tuple(params)
+
+
 class DatabaseManager:
-    def __init__(self,db):
+    def __init__(self, db, batch_size=1000, contributor_cache_size=200000, page_cache_size=20000):
+        """
+        Args:
+            db: Initialized peewee database
+            batch_size: Number of buffered revisions after which add_revision flushes automatically
+            contributor_cache_size: Maximum number of usernames kept in the contributor id cache
+            page_cache_size: Maximum number of pages kept in the page cache
+        """
         self.db = db
         if self.db.is_closed():
             self.db.connect()
+        backfill_page_contributors = not self.db.table_exists('pagecontributor')
+        backfill_activity_rollups = not self.db.table_exists('activitymonth')
         self._ensure_tables_exist()
-        self._create_index()
+        self._migrate()
+        self._drop_stale_indexes()
+        self._create_triggers()
+        if backfill_page_contributors:
+            self.rebuild_page_contributors()
+        if backfill_activity_rollups:
+            self.rebuild_activity_rollups()
+        if not self.db.table_exists('sqlite_stat1') and not self.db.execute_sql('PRAGMA query_only').fetchone()[0]:
+            self.update_statistics()
+
+        self.batch_size = batch_size
+        self._pending_pages = {}
+        self._pending_revisions = []
+        self._pending_crawl_pages = []
+        self._rows_written = 0
+        self._write_seconds = 0.0
+
+        # Identity maps username -> contributor id and page id -> Page, so repeated lookups skip SQLite
+        self.contributor_ids = LRUCache(contributor_cache_size)
+        self.pages = LRUCache(page_cache_size)
+        self._warm_up_caches()
 
     def _ensure_tables_exist(self):
         """Ensure the database tables are created."""
-        self.db.create_tables([Page, Contributor, Revision, MainCategory, Crawls], safe=True)
-                
+        self.db.create_tables([Page, Contributor, Revision, MainCategory, Crawls, CategoryLink, CrawlCategory, CrawlPage, PageContributor,
+                               ActivityMonth, ActivityMonthPage, ActivityMonthContributor], safe=True)
+
+    def _migrate(self):
+        """Bring tables created by earlier versions of the models up to date."""
+        migrator = SqliteMigrator(self.db)
+        operations = []
+
+        crawl_columns = {column.name: column for column in self.db.get_columns('crawls')}
+        for field in (Crawls.status, Crawls.incremental, Crawls.fetched_pages, Crawls.fetched_revisions, Crawls.duplicate_pages):
+            if field.column_name not in crawl_columns:
+                operations.append(migrator.add_column('crawls', field.column_name, field))
+        if not crawl_columns['end_time'].null:
+            operations.append(migrator.drop_not_null('crawls', 'end_time'))
+
+        category_columns = {column.name for column in self.db.get_columns('maincategory')}
+        if MainCategory.category_depth.column_name not in category_columns:
+            operations.append(migrator.add_column('maincategory', 'category_depth', MainCategory.category_depth))
+
+        revision_columns = {column.name for column in self.db.get_columns('revision')}
+        backfill_epochs = Revision.timestamp_epoch.column_name not in revision_columns
+        if backfill_epochs:
+            # create_tables already created the indexes over the column before it existed, SQLite then
+            # reads the quoted column name as a string literal, so these indexes are rebuilt afterwards
+            for index in self.db.get_indexes('revision'):
+                if 'timestamp_epoch' in (index.sql or ''):
+                    operations.append(migrator.drop_index('revision', index.name))
+            operations.append(migrator.add_column('revision', 'timestamp_epoch', Revision.timestamp_epoch))
+
+        if operations:
+            with self.db.atomic():
+                migrate(*operations)
+                if backfill_epochs:
+                    self.db.execute_sql("UPDATE revision SET timestamp_epoch = CAST(strftime('%s', timestamp) AS INTEGER)")
+                    Revision._schema.create_indexes(safe=True)
+
+    def _drop_stale_indexes(self):
+        """Drop indexes of the revision and incidence tables that the models no longer define, each one slows down every insert."""
+        with self.db.atomic():
+            for model in (Revision, PageContributor):
+                defined = {index._name for index in model._meta.fields_to_index()}
+                for index in self.db.get_indexes(model._meta.table_name):
+                    if index.name not in defined and not index.name.startswith('sqlite_autoindex'):
+                        self.db.execute_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+                        print(f"Dropped index {index.name}")
+
+
+    def update_statistics(self):
+        """
+        Refresh the table statistics the query planner uses to choose between indexes.
+
+        Without them SQLite picks the category-wide index for the per-contributor queries. Sampled
+        statistics (analysis_limit) are not enough for that, a full ANALYZE takes well under a second
+        for "Machine learning". Run this after a crawl has added many revisions.
+        """
+        self.db.execute_sql('ANALYZE')
+
+    def _create_triggers(self):
+        """
+        Keep the pagecontributor incidence table in step with the revision table.
+
+        Every inserted revision increments the edit count of its (main category, page, contributor)
+        row and widens its time span. A deleted revision removes the row if it was the last one,
+        otherwise it decrements the count and the time span is recomputed from the remaining revisions.
+        Revisions skipped by ON CONFLICT DO NOTHING do not fire the trigger.
+        """
+        with self.db.atomic():
+            self.db.execute_sql('''
+                CREATE TRIGGER IF NOT EXISTS revision_page_contributor_insert
+                AFTER INSERT ON revision
+                BEGIN
+                    INSERT INTO pagecontributor (main_category_id, page_id, contributor_id, revisions, first_timestamp, last_timestamp)
+                    VALUES (NEW.main_category_id, NEW.page_id, NEW.contributor_id, 1, NEW.timestamp, NEW.timestamp)
+                    ON CONFLICT (main_category_id, page_id, contributor_id) DO UPDATE SET
+                        revisions = revisions + 1,
+                        first_timestamp = MIN(first_timestamp, excluded.first_timestamp),
+                        last_timestamp = MAX(last_timestamp, excluded.last_timestamp);
+                END
+            ''')
+            self.db.execute_sql('''
+                CREATE TRIGGER IF NOT EXISTS revision_page_contributor_delete
+                AFTER DELETE ON revision
+                BEGIN
+                    DELETE FROM pagecontributor
+                    WHERE main_category_id = OLD.main_category_id AND page_id = OLD.page_id AND contributor_id = OLD.contributor_id
+                        AND revisions <= 1;
+                    UPDATE pagecontributor SET
+                        revisions = revisions - 1,
+                        first_timestamp = (
+                            SELECT MIN(timestamp) FROM revision
+                            WHERE page_id = OLD.page_id AND main_category_id = OLD.main_category_id AND contributor_id = OLD.contributor_id
+                        ),
+                        last_timestamp = (
+                            SELECT MAX(timestamp) FROM revision
+                            WHERE page_id = OLD.page_id AND main_category_id = OLD.main_category_id AND contributor_id = OLD.contributor_id
+                        )
+                    WHERE main_category_id = OLD.main_category_id AND page_id = OLD.page_id AND contributor_id = OLD.contributor_id;
+                END
+            ''')
+            self._create_activity_triggers()
+
+    def _create_activity_triggers(self):
+        """
+        Keep the monthly activity rollups in step with the revision table.
+
+        A revision increments the revision count of its month and of its page and contributor in
+        that month. The distinct page and contributor counts of a month change exactly when a page
+        or contributor enters or leaves the month's member set, which the triggers on the member
+        tables take care of. An upsert resolved as update fires no insert trigger.
+        """
+        for member, counter in (('activitymonthpage', 'unique_pages'), ('activitymonthcontributor', 'unique_contributors')):
+            self.db.execute_sql(f'''
+                CREATE TRIGGER IF NOT EXISTS {member}_insert
+                AFTER INSERT ON {member}
+                BEGIN
+                    UPDATE activitymonth SET {counter} = {counter} + 1
+                    WHERE main_category_id = NEW.main_category_id AND month = NEW.month;
+                END
+            ''')
+            self.db.execute_sql(f'''
+                CREATE TRIGGER IF NOT EXISTS {member}_delete
+                AFTER DELETE ON {member}
+                BEGIN
+                    UPDATE activitymonth SET {counter} = {counter} - 1
+                    WHERE main_category_id = OLD.main_category_id AND month = OLD.month;
+                END
+            ''')
+
+        self.db.execute_sql('''
+            CREATE TRIGGER IF NOT EXISTS revision_activity_insert
+            AFTER INSERT ON revision
+            BEGIN
+                INSERT INTO activitymonth (main_category_id, month, revisions, unique_pages, unique_contributors)
+                VALUES (NEW.main_category_id, strftime('%Y-%m', NEW.timestamp), 1, 0, 0)
+                ON CONFLICT (main_category_id, month) DO UPDATE SET revisions = revisions + 1;
+                INSERT INTO activitymonthpage (main_category_id, month, page_id, revisions)
+                VALUES (NEW.main_category_id, strftime('%Y-%m', NEW.timestamp), NEW.page_id, 1)
+                ON CONFLICT (main_category_id, month, page_id) DO UPDATE SET revisions = revisions + 1;
+                INSERT INTO activitymonthcontributor (main_category_id, month, contributor_id, revisions)
+                VALUES (NEW.main_category_id, strftime('%Y-%m', NEW.timestamp), NEW.contributor_id, 1)
+                ON CONFLICT (main_category_id, month, contributor_id) DO UPDATE SET revisions = revisions + 1;
+            END
+        ''')
+        self.db.execute_sql('''
+            CREATE TRIGGER IF NOT EXISTS revision_activity_delete
+            AFTER DELETE ON revision
+            BEGIN
+                DELETE FROM activitymonthpage
+                WHERE main_category_id = OLD.main_category_id AND month = strftime('%Y-%m', OLD.timestamp)
+                    AND page_id = OLD.page_id AND revisions <= 1;
+                UPDATE activitymonthpage SET revisions = revisions - 1
+                WHERE main_category_id = OLD.main_category_id AND month = strftime('%Y-%m', OLD.timestamp)
+                    AND page_id = OLD.page_id;
+                DELETE FROM activitymonthcontributor
+                WHERE main_category_id = OLD.main_category_id AND month = strftime('%Y-%m', OLD.timestamp)
+                    AND contributor_id = OLD.contributor_id AND revisions <= 1;
+                UPDATE activitymonthcontributor SET revisions = revisions - 1
+                WHERE main_category_id = OLD.main_category_id AND month = strftime('%Y-%m', OLD.timestamp)
+                    AND contributor_id = OLD.contributor_id;
+                DELETE FROM activitymonth
+                WHERE main_category_id = OLD.main_category_id AND month = strftime('%Y-%m', OLD.timestamp) AND revisions <= 1;
+                UPDATE activitymonth SET revisions = revisions - 1
+                WHERE main_category_id = OLD.main_category_id AND month = strftime('%Y-%m', OLD.timestamp);
+            END
+        ''')
 
-    def _create_index(self):
+    def rebuild_page_contributors(self, main_category_id=None):
+        """
+        Recompute the pagecontributor incidence table from the revision table, e.g. for a database
+        created before the table existed.
+
+        Args:
+            main_category_id: Optional ID of the only main category to rebuild
+        """
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+        condition = 'WHERE main_category_id = ?' if main_category_id is not None else ''
+        params = (main_category_id,) if main_category_id is not None else ()
+        with self.db.atomic():
+            self.db.execute_sql(f'DELETE FROM pagecontributor {condition}', params)
+            self.db.execute_sql(f'''
+                INSERT INTO pagecontributor (main_category_id, page_id, contributor_id, revisions, first_timestamp, last_timestamp)
+                SELECT main_category_id, page_id, contributor_id, COUNT(*), MIN(timestamp), MAX(timestamp)
+                FROM revision
+                {condition}
+                GROUP BY main_category_id, page_id, contributor_id
+            ''', params)
+
+    def rebuild_activity_rollups(self, main_category_id=None):
+        """
+        Recompute the monthly activity rollups from the revision table.
+
+        Args:
+            main_category_id: Optional ID of the only main category to rebuild
+        """
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+        condition = 'WHERE main_category_id = ?' if main_category_id is not None else ''
+        params = (main_category_id,) if main_category_id is not None else ()
         with self.db.atomic():
-            try:
-                self.db.execute_sql('''
-                    CREATE INDEX IF NOT EXISTS idx_revision_contributor_category 
-                    ON revision (contributor_id, main_category_id)
-                ''')
-                self.db.execute_sql('''
-                    CREATE INDEX IF NOT EXISTS idx_revision_page_category 
-                    ON revision (page_id, main_category_id)
-                ''')
-            except Exception as e:
-                print(f"Error creating indexes: {str(e)}")
+            for table in ('activitymonthpage', 'activitymonthcontributor', 'activitymonth'):
+                self.db.execute_sql(f'DELETE FROM {table} {condition}', params)
+            # The distinct counts start at 0 and are counted up by the triggers of the member tables
+            self.db.execute_sql(f'''
+                INSERT INTO activitymonth (main_category_id, month, revisions, unique_pages, unique_contributors)
+                SELECT main_category_id, strftime('%Y-%m', timestamp) AS month, COUNT(*), 0, 0
+                FROM revision {condition}
+                GROUP BY main_category_id, month
+            ''', params)
+            for member, column in (('activitymonthpage', 'page_id'), ('activitymonthcontributor', 'contributor_id')):
+                self.db.execute_sql(f'''
+                    INSERT INTO {member} (main_category_id, month, {column}, revisions)
+                    SELECT main_category_id, strftime('%Y-%m', timestamp) AS month, {column}, COUNT(*)
+                    FROM revision {condition}
+                    GROUP BY main_category_id, month, {column}
+                ''', params)
 
+    def _warm_up_caches(self):
+        """Fill the contributor cache with the most recently created contributors."""
+        query = (
+            Contributor
+            .select(Contributor.id, Contributor.username)
+            .order_by(Contributor.id.desc())
+            .limit(self.contributor_ids.maxsize)
+        )
+        for contributor_id, username in reversed(list(query.tuples())):
+            self.contributor_ids.put(username, contributor_id)
 
+    def get_cache_stats(self):
+        """Size, hit and miss counters of the contributor and page caches."""
+        return {
+            'contributors': self.contributor_ids.stats(),
+            'pages': self.pages.stats(),
+        }
 
     def get_or_create_page(self, page_id, page_name):
-        page, created = Page.get_or_create(id=page_id, defaults={'name': page_name})
+        page = self.pages.get(page_id)
+        if page is None:
+            page, created = Page.get_or_create(id=page_id, defaults={'name': page_name})
+            self.pages.put(page_id, page)
         return page
 
     def get_or_create_contributor(self, username):
-        contributor, created = Contributor.get_or_create(username=username)
-        return contributor
+        contributor_id = self.contributor_ids.get(username)
+        if contributor_id is None:
+            contributor, created = Contributor.get_or_create(username=username)
+            self.contributor_ids.put(username, contributor.id)
+            return contributor
+        return Contributor(id=contributor_id, username=username)
 
     def create_revision(self, revision_id, page, contributor, timestamp, main_category_id):
         revision, created = Revision.get_or_create(
@@ -47,15 +339,110 @@ class DatabaseManager:
                 'page': page,
                 'contributor': contributor,
                 'timestamp': timestamp,
+                'timestamp_epoch': to_epoch(timestamp),
                 'main_category': main_category_id
             }
         )
         return revision
 
+    def add_page(self, page_id, page_name):
+        """Buffer a page, it is written with the next flush()."""
+        self._pending_pages[page_id] = page_name
+
+    def add_revision(self, revision_id, page_id, username, timestamp, main_category_id):
+        """Buffer a revision together with its contributor, flushing once batch_size revisions are pending."""
+        self._pending_revisions.append((revision_id, page_id, username, timestamp, main_category_id))
+        if len(self._pending_revisions) >= self.batch_size:
+            self.flush()
+
+    def add_page_revisions(self, page_id, revisions, main_category_id):
+        """Buffer a batch of (revision_id, username, timestamp) revisions of a page, flushing once batch_size revisions are pending."""
+        self._pending_revisions.extend(
+            (revision_id, page_id, username, timestamp, main_category_id) for revision_id, username, timestamp in revisions
+        )
+        if len(self._pending_revisions) >= self.batch_size:
+            self.flush()
+
+    def add_completed_page(self, crawl_id, page_id):
+        """Buffer the checkpoint of a page, it is written in the same transaction as the page's last revisions."""
+        self._pending_crawl_pages.append((crawl_id, page_id))
+
+    def flush(self):
+        """
+        Write all buffered pages, contributors, revisions and page checkpoints with
+        multi-row INSERT ... ON CONFLICT DO NOTHING statements inside one transaction.
+
+        Returns:
+            Number of rows submitted to the database
+        """
+        if not self._pending_pages and not self._pending_revisions and not self._pending_crawl_pages:
+            return 0
+
+        start = perf_counter()
+        page_rows = [(page_id, name) for page_id, name in self._pending_pages.items() if self.pages.get(page_id) is None]
+
+        # Only usernames missing from the cache have to be inserted and looked up
+        contributor_ids = {}
+        usernames = []
+        for username in {username for _, _, username, _, _ in self._pending_revisions}:
+            contributor_id = self.contributor_ids.get(username)
+            if contributor_id is None:
+                usernames.append(username)
+            else:
+                contributor_ids[username] = contributor_id
+
+        with self.db.atomic():
+            for batch in chunked(page_rows, SQLITE_MAX_VARIABLES // 2):
+                Page.insert_many(batch, fields=[Page.id, Page.name]).on_conflict('NOTHING').execute()
+
+            for batch in chunked(usernames, SQLITE_MAX_VARIABLES):
+                Contributor.insert_many([(username,) for username in batch], fields=[Contributor.username]).on_conflict('NOTHING').execute()
+                query = Contributor.select(Contributor.id, Contributor.username).where(Contributor.username.in_(batch))
+                contributor_ids.update({username: contributor_id for contributor_id, username in query.tuples()})
+
+            revision_rows = [
+                (revision_id, main_category_id, page_id, contributor_ids[username], timestamp, to_epoch(timestamp))
+                for revision_id, page_id, username, timestamp, main_category_id in self._pending_revisions
+            ]
+            fields = [Revision.id, Revision.main_category, Revision.page, Revision.contributor, Revision.timestamp, Revision.timestamp_epoch]
+            for batch in chunked(revision_rows, SQLITE_MAX_VARIABLES // len(fields)):
+                Revision.insert_many(batch, fields=fields).on_conflict('NOTHING').execute()
+
+            for batch in chunked(self._pending_crawl_pages, SQLITE_MAX_VARIABLES // 2):
+                CrawlPage.insert_many(batch, fields=[CrawlPage.crawl, CrawlPage.page_id]).on_conflict('NOTHING').execute()
+
+        # The caches are only updated once the transaction is committed
+        for page_id, name in page_rows:
+            self.pages.put(page_id, Page(id=page_id, name=name))
+        for username in usernames:
+            self.contributor_ids.put(username, contributor_ids[username])
+
+        rows = len(page_rows) + len(usernames) + len(revision_rows) + len(self._pending_crawl_pages)
+        self._rows_written += rows
+        self._write_seconds += perf_counter() - start
+        self._pending_pages = {}
+        self._pending_revisions = []
+        self._pending_crawl_pages = []
+        return rows
+
+    def get_write_stats(self):
+        """Rows written by flush() so far, the time spent and the resulting rows per second."""
+        return {
+            'rows': self._rows_written,
+            'seconds': self._write_seconds,
+            'rows_per_second': self._rows_written / self._write_seconds if self._write_seconds else 0.0,
+        }
+
     def get_or_create_main_category(self, category_name):
-        main_category = MainCategory.create(
-            name=category_name
+        main_category = (
+            MainCategory
+            .select()
+            .where(MainCategory.name == category_name)
+            .order_by(MainCategory.id)
+            .first()
         )
+        if main_category is None:
+            main_category = MainCategory.create(name=category_name)
         return main_category
 
     def get_main_category_by_name(self, category_name):
@@ -72,15 +459,133 @@ class DatabaseManager:
         main_category.save()
         return main_category
 
-    def create_crawl(self, main_category, depth, start_time, end_time):
+    def save_category_dag(self, main_category_id, depth, edges):
+        """
+        Cache the subcategory DAG of a main category discovered down to the given depth,
+        replacing a previously cached one.
+
+        Args:
+            edges: List of (parent, child, child_depth) tuples
+        """
+        rows = [(main_category_id, parent, child, child_depth) for parent, child, child_depth in edges]
+        fields = [CategoryLink.main_category, CategoryLink.parent, CategoryLink.child, CategoryLink.depth]
+        with self.db.atomic():
+            CategoryLink.delete().where(CategoryLink.main_category == main_category_id).execute()
+            for batch in chunked(rows, SQLITE_MAX_VARIABLES // len(fields)):
+                CategoryLink.insert_many(batch, fields=fields).execute()
+            MainCategory.update(category_depth=depth).where(MainCategory.id == main_category_id).execute()
+
+    def get_category_dag(self, main_category_id, depth):
+        """
+        Get the cached subcategory DAG of a main category restricted to the given depth as list
+        of (parent, child, child_depth) tuples, or None if it was not discovered that deep.
+        """
+        cached_depth = MainCategory.get_by_id(main_category_id).category_depth
+        if cached_depth is None or cached_depth < depth:
+            return None
+
+        query = (
+            CategoryLink
+            .select(CategoryLink.parent, CategoryLink.child, CategoryLink.depth)
+            .where((CategoryLink.main_category == main_category_id) & (CategoryLink.depth <= depth))
+            .order_by(CategoryLink.id)
+        )
+        # Depths are shortest distances, so dropping the deeper links yields the DAG of a shallower discovery
+        child_depths = {child: child_depth for _, child, child_depth in query.tuples()}
+        return [
+            (parent, child, child_depth) for parent, child, child_depth in query.tuples()
+            if child_depths.get(parent, 0) < depth
+        ]
+
+    def create_crawl(self, main_category, depth, start_time, end_time=None, incremental=False):
+        """Create a crawl entry, a crawl without end_time is 'running' and can be resumed."""
         crawl = Crawls.create(
             main_category=main_category,
             depth=depth,
             start_time=start_time,
-            end_time=end_time
+            end_time=end_time,
+            status='completed' if end_time else 'running',
+            incremental=incremental,
+            fetched_pages=0,
+            fetched_revisions=0,
+            duplicate_pages=0
         )
         return crawl
 
+    def finish_crawl(self, crawl_id, end_time):
+        Crawls.update(end_time=end_time, status='completed').where(Crawls.id == crawl_id).execute()
+
+    def get_crawl(self, crawl_id):
+        return Crawls.get_by_id(crawl_id)
+
+    def get_resumable_crawl(self, main_category_id):
+        """Get the most recent crawl of a main category that did not finish, or None."""
+        return (
+            Crawls
+            .select()
+            .where((Crawls.main_category == main_category_id) & (Crawls.status == 'running'))
+            .order_by(Crawls.id.desc())
+            .first()
+        )
+
+    def save_crawl_categories(self, crawl_id, categories):
+        """Persist the category frontier of a crawl as (name, depth) tuples."""
+        rows = [(crawl_id, name, depth) for name, depth in categories]
+        with self.db.atomic():
+            for batch in chunked(rows, SQLITE_MAX_VARIABLES // 3):
+                CrawlCategory.insert_many(
+                    batch, fields=[CrawlCategory.crawl, CrawlCategory.name, CrawlCategory.depth]
+                ).on_conflict('NOTHING').execute()
+
+    def get_crawl_categories(self, crawl_id):
+        """Get the category frontier of a crawl as (name, depth, completed) tuples in crawl order."""
+        query = (
+            CrawlCategory
+            .select(CrawlCategory.name, CrawlCategory.depth, CrawlCategory.completed)
+            .where(CrawlCategory.crawl == crawl_id)
+            .order_by(CrawlCategory.id)
+        )
+        return list(query.tuples())
+
+    def complete_crawl_category(self, crawl_id, category_name, fetched_pages=0, fetched_revisions=0, duplicate_pages=0):
+        """
+        Checkpoint a category, flushing first so that all of its revisions are stored. The pages and
+        revisions fetched and the duplicate page fetches saved for the category are added to the
+        counters of the crawl.
+        """
+        self.flush()
+        with self.db.atomic():
+            (
+                CrawlCategory
+                .update(completed=True)
+                .where((CrawlCategory.crawl == crawl_id) & (CrawlCategory.name == category_name))
+                .execute()
+            )
+            self.add_crawl_counts(crawl_id, fetched_pages, fetched_revisions, duplicate_pages)
+
+    def add_crawl_counts(self, crawl_id, fetched_pages=0, fetched_revisions=0, duplicate_pages=0):
+        """Add pages and revisions fetched and duplicate page fetches saved to the counters of a crawl."""
+        (
+            Crawls
+            .update(
+                fetched_pages=Crawls.fetched_pages + fetched_pages,
+                fetched_revisions=Crawls.fetched_revisions + fetched_revisions,
+                duplicate_pages=Crawls.duplicate_pages + duplicate_pages
+            )
+            .where(Crawls.id == crawl_id)
+            .execute()
+        )
+
+    def get_last_revision_ids(self):
+        """Get the newest stored revision id of every page as a dictionary {page_id: revision_id}."""
+        query = Revision.select(Revision.page, fn.MAX(Revision.id)).group_by(Revision.page)
+        return dict(query.tuples())
+
+    def get_completed_pages(self, crawl_id):
+        """Get the ids of all pages whose revisions have been stored by a crawl."""
+        query = CrawlPage.select(CrawlPage.page_id).where(CrawlPage.crawl == crawl_id)
+        return {page_id for page_id, in query.tuples()}
+
     def get_all_crawls(self):
             return Crawls.select()
 
@@ -90,22 +595,138 @@ class DatabaseManager:
     def get_all_pages(self):
         return Page.select()
 
-    def get_all_contributors(self, main_category_id=None):
+    def get_all_contributors(self, main_category_id=None, start=None, end=None):
+        if main_category_id and (start is not None or end is not None):
+            # Contributors active in the time window, found by a range scan over the epoch timestamps
+            revisions = Revision.select(Revision.contributor).where(Revision.main_category == main_category_id)
+            if start is not None:
+                revisions = revisions.where(Revision.timestamp_epoch >= to_epoch(start))
+            if end is not None:
+                revisions = revisions.where(Revision.timestamp_epoch < to_epoch(end))
+            return Contributor.select().where(Contributor.id.in_(revisions))
         if main_category_id:
             return (
                 Contributor.select()
-                .join(Revision)
-                .where(Revision.main_category == main_category_id)
+                .join(PageContributor)
+                .where(PageContributor.main_category == main_category_id)
                 .distinct()
             )
         else:
             return Contributor.select()
 
+    def iter_rows(self, query, chunk_size=10000, as_numpy=False):
+        """
+        Execute a query once and stream its rows in chunks, without creating model instances.
+
+        Args:
+            query: peewee query or tuple (sql, params)
+            chunk_size: Number of rows per yielded chunk
+            as_numpy: Yield int64 arrays of shape (rows, columns) instead of lists of tuples,
+                all selected columns must be integers
+
+        Yields:
+            Lists of row tuples or numpy arrays with at most chunk_size rows
+        """
+        sql, params = query if isinstance(query, tuple) else query.sql()
+        cursor = self.db.execute_sql(sql, params)
+        columns = len(cursor.description)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield np.array(rows, dtype=np.int64).reshape(-1, columns) if as_numpy else rows
+
+    def iter_revisions(self, main_category_id=None, start=None, end=None, chunk_size=10000, as_numpy=False):
+        """
+        Stream (id, page_id, contributor_id, timestamp_epoch) of the revisions, ordered by time.
+
+        Args:
+            main_category_id: Optional ID of the main category to filter by
+            start: Optional start of a time window, inclusive
+            end: Optional end of the time window, exclusive
+            chunk_size: Number of revisions per yielded chunk
+            as_numpy: Yield int64 arrays of shape (n, 4) instead of lists of tuples
+        """
+        query = Revision.select(Revision.id, Revision.page, Revision.contributor, Revision.timestamp_epoch)
+        if main_category_id is not None:
+            query = query.where(Revision.main_category == main_category_id)
+        if start is not None:
+            query = query.where(Revision.timestamp_epoch >= to_epoch(start))
+        if end is not None:
+            query = query.where(Revision.timestamp_epoch < to_epoch(end))
+        return self.iter_rows(query.order_by(Revision.timestamp_epoch, Revision.id), chunk_size, as_numpy)
+
+    def iter_contributors(self, main_category_id=None, start=None, end=None, chunk_size=10000, as_numpy=False):
+        """
+        Stream the contributors of get_all_contributors as (id, username) tuples, ordered by id.
+
+        Args:
+            main_category_id: Optional ID of the main category to filter by
+            start: Optional start of a time window, inclusive
+            end: Optional end of the time window, exclusive
+            chunk_size: Number of contributors per yielded chunk
+            as_numpy: Yield int64 arrays of the contributor ids only
+        """
+        query = self.get_all_contributors(main_category_id, start, end).order_by(Contributor.id)
+        columns = [Contributor.id] if as_numpy else [Contributor.id, Contributor.username]
+        return self.iter_rows(query.select(*columns), chunk_size, as_numpy)
+
+    def iter_pages(self, main_category_id=None, chunk_size=10000, as_numpy=False):
+        """
+        Stream (id, name) of the pages, ordered by id.
+
+        Args:
+            main_category_id: Optional ID of the main category to filter by
+            chunk_size: Number of pages per yielded chunk
+            as_numpy: Yield int64 arrays of the page ids only
+        """
+        query = Page.select(Page.id) if as_numpy else Page.select(Page.id, Page.name)
+        if main_category_id:
+            query = query.where(Page.id.in_(
+                PageContributor.select(PageContributor.page).where(PageContributor.main_category == main_category_id)
+            ))
+        return self.iter_rows(query.order_by(Page.id), chunk_size, as_numpy)
+
+    def iter_incidence(self, main_category_id, start=None, end=None, chunk_size=100000, as_numpy=False):
+        """
+        Stream the (contributor_id, page_id, revisions) incidence of a main category.
+
+        Without time window the rows come from the pagecontributor table, with a time window
+        they are aggregated from the revisions found by a range scan over their epoch timestamps.
+
+        Args:
+            main_category_id: ID of the main category
+            start: Optional start of a time window, inclusive
+            end: Optional end of the time window, exclusive
+            chunk_size: Number of rows per yielded chunk
+            as_numpy: Yield int64 arrays of shape (n, 3) instead of lists of tuples
+        """
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+        if start is None and end is None:
+            query = (
+                PageContributor
+                .select(PageContributor.contributor, PageContributor.page, PageContributor.revisions)
+                .where(PageContributor.main_category == main_category_id)
+            )
+            return self.iter_rows(query, chunk_size, as_numpy)
+        window, params = time_window(start, end)
+        sql = f'''
+            SELECT contributor_id, page_id, COUNT(*)
+            FROM revision
+            WHERE main_category_id = ?{window}
+            GROUP BY contributor_id, page_id
+        '''
+        return self.iter_rows((sql, (main_category_id,) + params), chunk_size, as_numpy)
+
     def get_all_categories(self):
         return MainCategory.select()
 
     def delete_category_by_id(self, category_id):
-        MainCategory.delete().where(MainCategory.id == category_id).execute()
+        with self.db.atomic():
+            PageContributor.delete().where(PageContributor.main_category == category_id).execute()
+            for model in (ActivityMonthPage, ActivityMonthContributor, ActivityMonth):
+                model.delete().where(model.main_category == category_id).execute()
+            MainCategory.delete().where(MainCategory.id == category_id).execute()
 
     def delete_crawl_by_id(self, crawl_id):
         Crawls.delete().where(Crawls.id == crawl_id).execute()
@@ -116,33 +737,6 @@ class DatabaseManager:
         crawl.save()
         return crawl
 
-    def get_unique_stats_per_month(self, main_category_id):
-        """Get unique contributors and pages per month, optionally filtered by main_category_id, as a Pandas DataFrame."""
-        from peewee import fn
-
-        query = (
-            Revision
-            .select(
-                fn.strftime('%Y-%m', Revision.timestamp).alias('month'),  # Extract year and month
-                fn.COUNT(Revision.id).alias('total_contributions'),
-                fn.COUNT(fn.DISTINCT(Revision.page)).alias('unique_pages'),
-                fn.COUNT(fn.DISTINCT(Revision.contributor)).alias('unique_contributors')
-            )
-            .group_by(fn.strftime('%Y-%m', Revision.timestamp))
-            .order_by(fn.strftime('%Y-%m', Revision.timestamp))
-        )
-    
-        query = query.where(Revision.main_category == main_category_id)
-
-        results = list(query.dicts())
-
-        df = pd.DataFrame(results)
-
-        if not df.empty:
-            df['month'] = pd.to_datetime(df['month'], format='%Y-%m')
-
-        return df
-
     def get_unique_stats_per_month(self, main_category_id, contributor_ids=None):
         """
         Get unique contributors and pages per month, filtered by main_category_id and optionally by contributor_ids.
@@ -154,61 +748,95 @@ class DatabaseManager:
         Returns:
             Pandas DataFrame with monthly statistics
         """
-        from peewee import fn
-        
-        query = (
-            Revision
-            .select(
-                fn.strftime('%Y-%m', Revision.timestamp).alias('month'),
-                fn.COUNT(Revision.id).alias('total_contributions'),
-                fn.COUNT(fn.DISTINCT(Revision.page)).alias('unique_pages'),
-                fn.COUNT(fn.DISTINCT(Revision.contributor)).alias('unique_contributors')
-            )
-            .group_by(fn.strftime('%Y-%m', Revision.timestamp))
-            .order_by(fn.strftime('%Y-%m', Revision.timestamp))
-        )
-        
-        # Base filter for main category
-        query = query.where(Revision.main_category == main_category_id)
-        
-        # Add contributor filter if provided
-        if contributor_ids:
-            query = query.where(Revision.contributor.in_(contributor_ids))
-        
-        results = list(query.dicts())
-        df = pd.DataFrame(results)
-        
-        if not df.empty:
-            df['month'] = pd.to_datetime(df['month'], format='%Y-%m')
-        
+        return self.get_activity_stats(main_category_id, period='month', contributor_ids=contributor_ids)
+
+    def get_activity_stats(self, main_category_id, period='month', contributor_ids=None, start=None, end=None):
+        """
+        Get the number of revisions, unique pages and unique contributors per month, quarter or year.
+
+        Without contributor_ids and time window the stats come from the monthly rollup tables:
+        months are read as they are, quarters and years count the distinct members of their months,
+        so a page edited in several months of a quarter is counted once. Otherwise the matching
+        revisions are aggregated directly, found by a range scan over their epoch timestamps.
+
+        Args:
+            main_category_id: ID of the main category to filter by
+            period: 'month', 'quarter' or 'year'
+            contributor_ids: Optional list of contributor IDs to filter by
+            start: Optional start of the time window (datetime, ISO 8601 string or epoch seconds), inclusive
+            end: Optional end of the time window, exclusive
+
+        Returns:
+            Pandas DataFrame with the columns <period> (start of the period), total_contributions,
+            unique_pages and unique_contributors
+        """
+        if period not in PERIOD_STARTS:
+            raise ValueError(f"period must be one of {list(PERIOD_STARTS)}, not '{period}'")
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+
+        if contributor_ids or start is not None or end is not None:
+            key = PERIOD_STARTS[period].format(month="strftime('%Y-%m', timestamp_epoch, 'unixepoch')")
+            window, params = time_window(start, end)
+            if contributor_ids:
+                window += ' AND contributor_id IN (SELECT value FROM json_each(?))'
+                params += (json.dumps([int(contributor_id) for contributor_id in contributor_ids]),)
+            cursor = self.db.execute_sql(f'''
+                SELECT {key} AS period, COUNT(*), COUNT(DISTINCT page_id), COUNT(DISTINCT contributor_id)
+                FROM revision
+                WHERE main_category_id = ?{window}
+                GROUP BY period
+                ORDER BY period
+            ''', (main_category_id,) + params)
+        elif period == 'month':
+            cursor = self.db.execute_sql('''
+                SELECT month, revisions, unique_pages, unique_contributors
+                FROM activitymonth
+                WHERE main_category_id = ?
+                ORDER BY month
+            ''', (main_category_id,))
+        else:
+            key = PERIOD_STARTS[period].format(month='month')
+            cursor = self.db.execute_sql(f'''
+                SELECT r.period, r.revisions, p.unique_pages, c.unique_contributors
+                FROM (
+                    SELECT {key} AS period, SUM(revisions) AS revisions
+                    FROM activitymonth WHERE main_category_id = ? GROUP BY period
+                ) r
+                JOIN (
+                    SELECT {key} AS period, COUNT(DISTINCT page_id) AS unique_pages
+                    FROM activitymonthpage WHERE main_category_id = ? GROUP BY period
+                ) p ON p.period = r.period
+                JOIN (
+                    SELECT {key} AS period, COUNT(DISTINCT contributor_id) AS unique_contributors
+                    FROM activitymonthcontributor WHERE main_category_id = ? GROUP BY period
+                ) c ON c.period = r.period
+                ORDER BY r.period
+            ''', (main_category_id,) * 3)
+
+        df = pd.DataFrame(cursor.fetchall(), columns=[period, 'total_contributions', 'unique_pages', 'unique_contributors'])
+        df[period] = pd.to_datetime(df[period], format='%Y-%m')
         return df
 
     def get_co_contributors(self, contributor_id, main_category_id):
         """Get unique co-contributors' IDs for a given contributor_id within the same main category."""
-        pages_subquery = (
-            Page
-            .select(Page.id)
-            .join(Revision)
-            .where(
-                (Revision.contributor == contributor_id) & 
-                (Revision.main_category == main_category_id)
-            )
-            .distinct()
-        )
-        
+        # Joined page by page, an IN subquery lets the planner walk the whole category instead
+        own_pages = PageContributor.alias()
         query = (
-            Contributor
-            .select(Contributor.id)
-            .join(Revision)
+            PageContributor
+            .select(PageContributor.contributor)
+            .join(own_pages, on=(
+                (own_pages.main_category == PageContributor.main_category) &
+                (own_pages.page == PageContributor.page)
+            ))
             .where(
-                (Revision.page.in_(pages_subquery)) & 
-                (Contributor.id != contributor_id) &
-                (Revision.main_category == main_category_id)
+                (own_pages.contributor == contributor_id) &
+                (own_pages.main_category == main_category_id) &
+                (PageContributor.contributor != contributor_id)
             )
             .distinct()
         )
         
-        co_contributors = [contributor.id for contributor in query]
+        co_contributors = [co_contributor_id for co_contributor_id, in query.tuples()]
         return co_contributors
 
     def get_co_contributors_weighted(self, contributor_id, main_category_id):
@@ -216,58 +844,329 @@ class DatabaseManager:
         Get co-contributors' IDs and their co-contribution counts for a given contributor_id.
         Returns a dictionary of {co_contributor_id: count}.
         """
-        pages_subquery = (
-            Page
-            .select(Page.id)
-            .join(Revision)
+        own_pages = PageContributor.alias()
+        query = (
+            PageContributor
+            .select(
+                PageContributor.contributor,
+                fn.SUM(PageContributor.revisions).alias('co_contribution_count')
+            )
+            .join(own_pages, on=(
+                (own_pages.main_category == PageContributor.main_category) &
+                (own_pages.page == PageContributor.page)
+            ))
             .where(
-                (Revision.contributor == contributor_id) &
-                (Revision.main_category == main_category_id)
+                (own_pages.contributor == contributor_id) &
+                (own_pages.main_category == main_category_id) &
+                (PageContributor.contributor != contributor_id)
             )
-            .distinct()
+            .group_by(PageContributor.contributor)
+        )
+        
+        return {co_contributor_id: count for co_contributor_id, count in query.tuples()}
+
+    def iter_co_contribution_edges(self, main_category_id, weighted=False, chunk_size=100000, start=None, end=None):
+        """
+        Stream the co-contribution edge list of a main category, computed by one aggregate query.
+
+        Every undirected pair of contributors who edited a common page appears exactly once, with
+        the smaller contributor id first. The weight is the one get_co_contributors_weighted gives,
+        taken in the larger of the two directions: the revisions one contributor made on the pages
+        the other one edited.
+
+        Args:
+            main_category_id: ID of the main category
+            weighted: Include the weight as third column
+            chunk_size: Number of edges per yielded chunk
+            start: Optional start of a time window, only revisions from then on count, inclusive
+            end: Optional end of the time window, exclusive
+
+        Yields:
+            int64 numpy arrays of shape (n, 2) with contributor ids, (n, 3) if weighted
+        """
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+        weight = ', MAX(SUM(a.revisions), SUM(b.revisions))' if weighted else ''
+        if start is None and end is None:
+            # The self join runs over the incidence table, which holds each (page, contributor) pair once
+            query = f'''
+                SELECT a.contributor_id, b.contributor_id{weight}
+                FROM pagecontributor a
+                JOIN pagecontributor b
+                    ON a.main_category_id = b.main_category_id AND a.page_id = b.page_id AND a.contributor_id < b.contributor_id
+                WHERE a.main_category_id = ?
+                GROUP BY a.contributor_id, b.contributor_id
+            '''
+            params = (main_category_id,)
+        else:
+            # The incidence of the time window is aggregated from a range scan over the epoch timestamps
+            window, params = time_window(start, end)
+            query = f'''
+                WITH incidence AS (
+                    SELECT page_id, contributor_id, COUNT(*) AS revisions
+                    FROM revision
+                    WHERE main_category_id = ?{window}
+                    GROUP BY page_id, contributor_id
+                )
+                SELECT a.contributor_id, b.contributor_id{weight}
+                FROM incidence a
+                JOIN incidence b ON a.page_id = b.page_id AND a.contributor_id < b.contributor_id
+                GROUP BY a.contributor_id, b.contributor_id
+            '''
+            params = (main_category_id,) + params
+        yield from self.iter_rows((query, params), chunk_size, as_numpy=True)
+
+    def check_query_plans(self, main_category_id, contributor_id=None, start=None, end=None):
+        """
+        Run the hot queries of the crawl and the analysis and check their plans with EXPLAIN QUERY PLAN.
+
+        Every statement the hot queries execute is captured and explained. A statement that scans the
+        revision or the pagecontributor table instead of searching one of their indexes is a full scan.
+        The queries of one contributor also have to search these tables by contributor or page, a
+        search by the main category alone walks the whole category for a single contributor.
+        Only the category-wide aggregates may do that.
+        The table statistics are refreshed first if the database is writable, otherwise the planner
+        of a freshly populated database works with the statistics of an empty one.
+
+        Args:
+            main_category_id: ID of the main category to run the queries for
+            contributor_id: Contributor for the per-contributor queries, by default the first one of the category
+            start: Start of the time window queries, by default the oldest revision of the category
+            end: End of the time window queries, by default one year after start
+
+        Returns:
+            Dictionary query name -> list of the plan lines of its statements
+
+        Raises:
+            RuntimeError: If any hot query falls back to a full scan or a search of the whole category
+        """
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+        if contributor_id is None:
+            contributor_id = (
+                PageContributor.select(PageContributor.contributor)
+                .where(PageContributor.main_category == main_category_id)
+                .limit(1)
+                .scalar()
+            )
+        if start is None:
+            start = Revision.select(fn.MIN(Revision.timestamp_epoch)).where(Revision.main_category == main_category_id).scalar() or 0
+        if end is None:
+            end = to_epoch(start) + 365 * 24 * 3600
+
+        # Query name -> (query, columns one of which every search of the checked tables has to use).
+        # Without columns, a search by the main category alone is fine
+        per_contributor = ('contributor_id', 'page_id')
+        hot_queries = {
+            'co-contributors': (lambda: self.get_co_contributors(contributor_id, main_category_id), per_contributor),
+            'weighted co-contributors': (lambda: self.get_co_contributors_weighted(contributor_id, main_category_id), per_contributor),
+            'co-contribution edges': (lambda: next(self.iter_co_contribution_edges(main_category_id, weighted=True), None), ()),
+            'windowed co-contribution edges': (lambda: next(self.iter_co_contribution_edges(
+                main_category_id, weighted=True, start=start, end=end), None), ()),
+            'distinct contributors per page': (lambda: self.get_distinct_contributors_per_page(main_category_id), ()),
+            'monthly stats': (lambda: self.get_activity_stats(main_category_id), ()),
+            'quarterly stats': (lambda: self.get_activity_stats(main_category_id, period='quarter'), ()),
+            'windowed monthly stats': (lambda: self.get_activity_stats(main_category_id, start=start, end=end), ()),
+            'monthly stats of a contributor': (lambda: self.get_activity_stats(
+                main_category_id, contributor_ids=[contributor_id]), per_contributor),
+            'revisions of a contributor': (lambda: self.get_number_of_revisions_per_contributor(
+                contributor_id, main_category_id), per_contributor),
+            'oldest and newest revision of a contributor': (lambda: self.get_oldest_and_newest_revision_per_contributor_and_main_category(
+                contributor_id, main_category_id), per_contributor),
+        }
+        if not self.db.execute_sql('PRAGMA query_only').fetchone()[0]:
+            self.update_statistics()
+        checked_tables = {Revision._meta.table_name, PageContributor._meta.table_name}
+
+        # peewee logs every statement it executes, which captures the SQL exactly as the methods build it
+        statements = []
+        handler = logging.Handler()
+        handler.emit = lambda record: statements.append(record.msg)
+        logger = logging.getLogger('peewee')
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        plans, full_scans = {}, []
+        try:
+            for name, (query, key_columns) in hot_queries.items():
+                statements.clear()
+                query()
+                plans[name] = []
+                for sql, params in list(statements):
+                    lines = [row[3] for row in self.db.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+                    plans[name].extend(lines)
+                    # The plans name tables by their alias, e.g. t1, which the statement maps back to the table.
+                    # Scans of other tables, materialized subqueries and CTEs are fine
+                    tables = {table: table for table in checked_tables}
+                    tables.update({
+                        alias: table for table, alias in re.findall(r'(?:FROM|JOIN)\s+"?(\w+)"?\s+(?:AS\s+)?"?(\w+)"?', sql, re.IGNORECASE)
+                    })
+                    for line in lines:
+                        words = line.split()
+                        if len(words) < 2 or tables.get(words[1]) not in checked_tables:
+                            continue
+                        if words[0] == 'SCAN':
+                            full_scans.append(f'{name}: {line}')
+                        elif words[0] == 'SEARCH' and key_columns:
+                            # The constraints of the search, e.g. (main_category_id=? AND contributor_id=?)
+                            constraints = re.search(r'\(([^()]*)\)$', line)
+                            columns = set(re.findall(r'(\w+)\s*[=<>]', constraints.group(1) if constraints else ''))
+                            if not columns & {*key_columns, 'rowid'}:
+                                full_scans.append(f'{name}: {line}')
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+
+        if full_scans:
+            raise RuntimeError('Hot queries without a usable index:\n' + '\n'.join(full_scans))
+        return plans
+
+    def get_distinct_contributors_per_page(self, main_category_id):
+        """Get the number of distinct contributors per page for a given main category."""
+        query = (
+            PageContributor
+            .select(
+                PageContributor.page,
+                fn.COUNT(PageContributor.contributor).alias('distinct_contributors')
+            )
+            .where(PageContributor.main_category == main_category_id)
+            .group_by(PageContributor.page)
         )
         
+        return {page_id: distinct_contributors for page_id, distinct_contributors in query.tuples()}
+
+    def get_page_stats(self, main_category_id):
+        """
+        Stats of all pages of a main category with one grouped query, the bulk form of Page.to_dict.
+
+        Returns:
+            Pandas DataFrame with one row per page: id, name, number_of_revisions,
+            number_of_contributors, first_revision and last_revision
+        """
         query = (
-            Contributor
+            PageContributor
             .select(
-                Contributor.id,
-                fn.COUNT(Revision.id).alias('co_contribution_count')
+                Page.id,
+                Page.name,
+                fn.SUM(PageContributor.revisions),
+                fn.COUNT(PageContributor.contributor),
+                fn.MIN(PageContributor.first_timestamp),
+                fn.MAX(PageContributor.last_timestamp)
             )
-            .join(Revision)
-            .where(
-                (Revision.page.in_(pages_subquery)) &
-                (Contributor.id != contributor_id) &
-                (Revision.main_category == main_category_id)
+            .join(Page)
+            .where(PageContributor.main_category == main_category_id)
+            .group_by(Page.id)
+            .order_by(Page.id)
+        )
+        columns = ['id', 'name', 'number_of_revisions', 'number_of_contributors', 'first_revision', 'last_revision']
+        return self._to_frame(query, columns, timestamps=['first_revision', 'last_revision'])
+
+    def get_contributor_stats(self, main_category_id):
+        """
+        Stats of all contributors of a main category with one grouped query, the bulk form of Contributor.to_dict.
+
+        Returns:
+            Pandas DataFrame with one row per contributor: id, username, number_of_pages,
+            number_of_contributions, first_revision and last_revision
+        """
+        query = (
+            PageContributor
+            .select(
+                Contributor.id,
+                Contributor.username,
+                fn.COUNT(PageContributor.page),
+                fn.SUM(PageContributor.revisions),
+                fn.MIN(PageContributor.first_timestamp),
+                fn.MAX(PageContributor.last_timestamp)
             )
+            .join(Contributor)
+            .where(PageContributor.main_category == main_category_id)
             .group_by(Contributor.id)
+            .order_by(Contributor.id)
         )
-        
-        return {c.id: c.co_contribution_count for c in query}
+        columns = ['id', 'username', 'number_of_pages', 'number_of_contributions', 'first_revision', 'last_revision']
+        return self._to_frame(query, columns, timestamps=['first_revision', 'last_revision'])
 
-    def get_distinct_contributors_per_page(self, main_category_id):
-        """Get the number of distinct contributors per page for a given main category."""
+    def get_category_stats(self):
+        """
+        Stats of all main categories with one grouped query, the bulk form of MainCategory.to_dict.
+
+        Returns:
+            Pandas DataFrame with one row per main category: id, name, number_of_subcategories,
+            number_of_pages, number_of_contributors and number_of_contributions
+        """
+        query = (
+            MainCategory
+            .select(
+                MainCategory.id,
+                MainCategory.name,
+                MainCategory.number_of_subcategories,
+                fn.COUNT(fn.DISTINCT(PageContributor.page)),
+                fn.COUNT(fn.DISTINCT(PageContributor.contributor)),
+                fn.COALESCE(fn.SUM(PageContributor.revisions), 0)
+            )
+            .join(PageContributor, JOIN.LEFT_OUTER)
+            .group_by(MainCategory.id)
+            .order_by(MainCategory.id)
+        )
+        columns = ['id', 'name', 'number_of_subcategories', 'number_of_pages', 'number_of_contributors', 'number_of_contributions']
+        return self._to_frame(query, columns)
+
+    def get_revisions(self, main_category_id=None, start=None, end=None):
+        """
+        List revisions with the names of their main category, page and contributor joined in one
+        query, the bulk form of Revision.to_dict.
+
+        Args:
+            main_category_id: Optional ID of the main category to filter by
+            start: Optional start of a time window, inclusive
+            end: Optional end of the time window, exclusive
+
+        Returns:
+            Pandas DataFrame with one row per revision: id, main_category, page_id, page,
+            contributor_id, contributor and timestamp
+        """
         query = (
             Revision
             .select(
-                Revision.page,
-                fn.COUNT(fn.DISTINCT(Revision.contributor)).alias('distinct_contributors')
+                Revision.id,
+                MainCategory.name,
+                Page.id,
+                Page.name,
+                Contributor.id,
+                Contributor.username,
+                Revision.timestamp
             )
-            .where(Revision.main_category == main_category_id)
-            .group_by(Revision.page)
+            .join(MainCategory).switch(Revision)
+            .join(Page).switch(Revision)
+            .join(Contributor)
+            .order_by(Revision.id)
         )
-        
-        return {r.page.id: r.distinct_contributors for r in query}
+        if main_category_id is not None:
+            query = query.where(Revision.main_category == main_category_id)
+        if start is not None:
+            query = query.where(Revision.timestamp_epoch >= to_epoch(start))
+        if end is not None:
+            query = query.where(Revision.timestamp_epoch < to_epoch(end))
+        columns = ['id', 'main_category', 'page_id', 'page', 'contributor_id', 'contributor', 'timestamp']
+        return self._to_frame(query, columns, timestamps=['timestamp'])
+
+    def _to_frame(self, query, columns, timestamps=()):
+        """Run a query on a plain cursor, without building model instances, and return the rows as DataFrame."""
+        cursor = self.db.execute_sql(*query.sql())
+        df = pd.DataFrame(cursor.fetchall(), columns=columns)
+        for column in timestamps:
+            df[column] = pd.to_datetime(df[column], utc=True, format='ISO8601')
+        return df
 
     def get_number_of_revisions_per_contributor(self, contributor_id, main_category_id):
 
         query = (
-            Revision
+            PageContributor
             .select(
-                fn.COUNT(Revision.id).alias('num_revisions')
+                fn.COALESCE(fn.SUM(PageContributor.revisions), 0).alias('num_revisions')
             )
             .where(
-                (Revision.contributor == contributor_id) &
-                (Revision.main_category == main_category_id)
+                (PageContributor.contributor == contributor_id) &
+                (PageContributor.main_category == main_category_id)
             )
         )
         return query.scalar()
@@ -281,17 +1180,41 @@ class DatabaseManager:
             .where(Revision.main_category == main_category_id)
         )
         return query.scalar()
-    
+
+    def get_content_fingerprint(self, main_category_id):
+        """
+        Fingerprint of the contents of a main category: number and highest id of its revisions, its newest
+        epoch timestamp and number of page-contributor pairs. Changes whenever revisions are added or removed.
+        Both queries are answered from the covering indexes.
+        """
+        main_category_id = getattr(main_category_id, 'id', main_category_id)
+        revisions, max_revision_id, max_timestamp = self.db.execute_sql(
+            'SELECT COUNT(*), MAX(id), MAX(timestamp_epoch) FROM revision WHERE main_category_id = ?',
+            (main_category_id,)
+        ).fetchone()
+        page_contributors = (
+            PageContributor
+            .select()
+            .where(PageContributor.main_category == main_category_id)
+            .count()
+        )
+        return {
+            'revisions': revisions,
+            'max_revision_id': max_revision_id,
+            'max_timestamp_epoch': max_timestamp,
+            'page_contributors': page_contributors,
+        }
+
     def get_oldest_and_newest_revision_per_contributor_and_main_category(self, contributor_id, main_category_id):
         query = (
-            Revision
+            PageContributor
             .select(
-                fn.MIN(Revision.timestamp).alias('oldest_revision'),
-                fn.MAX(Revision.timestamp).alias('newest_revision')
+                fn.MIN(PageContributor.first_timestamp).alias('oldest_revision'),
+                fn.MAX(PageContributor.last_timestamp).alias('newest_revision')
             )
             .where(
-                (Revision.contributor == contributor_id) &
-                (Revision.main_category == main_category_id)
+                (PageContributor.contributor == contributor_id) &
+                (PageContributor.main_category == main_category_id)
             )
         )
         return query.dicts().get()
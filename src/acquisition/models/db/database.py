@@ -1,14 +1,55 @@
+import os
 from peewee import SqliteDatabase
 
+DB_DIRECTORY = 'src/acquisition/models/db'
+
+# Named pragma sets for the two workloads. Both use WAL, so analysis connections can read
+# while a crawl writes, and synchronous=NORMAL, which in WAL mode only risks the last
+# transactions on power loss, never corruption. cache_size is in KiB when negative.
+PROFILES = {
+    'default': {},
+    'crawl': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -64 * 1024,         # 64 MiB page cache
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'memory',
+        'wal_autocheckpoint': 10000,      # checkpoint every ~40 MB of WAL instead of every ~4 MB
+    },
+    'analysis': {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -512 * 1024,        # 512 MiB page cache for the large GROUP BY and self joins
+        'mmap_size': 4 * 1024 * 1024 * 1024,
+        'temp_store': 'memory',
+    },
+}
+
 # Default to a placeholder database
 db = SqliteDatabase(None)  # Uninitialized database
 
-def initialize_db(db_name=None):
-    """Initialize the database connection conditionally."""
+def initialize_db(db_name=None, profile='default', read_only=False):
+    """
+    Initialize the database connection conditionally.
+
+    Args:
+        db_name: File name in src/acquisition/models/db or a path, None for an in-memory database
+        profile: Name of the pragma set from PROFILES, 'crawl' for crawling and 'analysis' for analysis
+        read_only: Open the database read-only, e.g. for an analysis notebook while a crawl is writing
+    """
     global db
-    if db_name:
-        db.init(f'src/acquisition/models/db/{db_name}')
+    pragmas = dict(PROFILES[profile])
+    if read_only:
+        if not db_name:
+            raise ValueError('An in-memory database cannot be opened read-only')
+        # The journal mode is a property of the database file and can only be set by a writer
+        pragmas.pop('journal_mode', None)
+        pragmas.pop('wal_autocheckpoint', None)
+        pragmas['query_only'] = 1
+        db.init(f'file:{os.path.join(DB_DIRECTORY, db_name)}?mode=ro', uri=True, pragmas=pragmas)
+    elif db_name:
+        db.init(os.path.join(DB_DIRECTORY, db_name), pragmas=pragmas)
     else:
-        db.init(':memory:')  # Default to in-memory DB if not specified
+        db.init(':memory:', pragmas=pragmas)  # Default to in-memory DB if not specified
     db.connect()
-    print(f"Database initialized: {db_name or 'in-memory'}")
+    print(f"Database initialized: {db_name or 'in-memory'} ({profile}{', read-only' if read_only else ''})")
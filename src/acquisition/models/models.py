@@ -1,4 +1,4 @@
-from peewee import SqliteDatabase, Model, IntegerField, CharField, ForeignKeyField, DateTimeField
+from peewee import fn, SqliteDatabase, Model, IntegerField, CharField, ForeignKeyField, DateTimeField, BooleanField, CompositeKey
 from datetime import datetime
 from src.acquisition.models.db.database import db
 
@@ -12,8 +12,9 @@ class Page(BaseModel):
     name = CharField(unique=True, null=False)
 
     def to_dict(self):
-        number_of_revisions = Revision.select().where(Revision.page == self).count()
-        number_of_contributors = Revision.select().where(Revision.page == self).distinct().count()
+        incidence = PageContributor.select().where(PageContributor.page == self)
+        number_of_revisions = incidence.select(fn.COALESCE(fn.SUM(PageContributor.revisions), 0)).scalar()
+        number_of_contributors = incidence.select(fn.COUNT(fn.DISTINCT(PageContributor.contributor))).scalar()
 
         return {
             "id": self.id,
@@ -27,8 +28,9 @@ class Contributor(BaseModel):
     username = CharField(unique=True, null=False)
 
     def to_dict(self):
-        number_of_pages = Page.select().join(Revision).where(Revision.contributor == self).distinct().count()
-        number_of_contributions = Revision.select().where(Revision.contributor == self).count()
+        incidence = PageContributor.select().where(PageContributor.contributor == self)
+        number_of_pages = incidence.select(fn.COUNT(fn.DISTINCT(PageContributor.page))).scalar()
+        number_of_contributions = incidence.select(fn.COALESCE(fn.SUM(PageContributor.revisions), 0)).scalar()
 
         return {
             "id": self.id,
@@ -41,19 +43,13 @@ class MainCategory(BaseModel):
     id = IntegerField(primary_key=True)
     name = CharField(null=False)
     number_of_subcategories = IntegerField(null=True)
+    category_depth = IntegerField(null=True)  # depth down to which the cached category DAG was discovered
 
     def to_dict(self):
-        number_of_pages = Page.select().join(Revision).where(Revision.main_category_id == self.id).distinct().count()
-
-        number_of_contributors = (
-            Contributor.select()
-            .join(Revision)
-            .where(Revision.main_category_id == self.id)
-            .distinct()
-            .count()
-        )
-
-        number_of_contributions = Revision.select().where(Revision.main_category_id == self.id).count()
+        incidence = PageContributor.select().where(PageContributor.main_category == self.id)
+        number_of_pages = incidence.select(fn.COUNT(fn.DISTINCT(PageContributor.page))).scalar()
+        number_of_contributors = incidence.select(fn.COUNT(fn.DISTINCT(PageContributor.contributor))).scalar()
+        number_of_contributions = incidence.select(fn.COALESCE(fn.SUM(PageContributor.revisions), 0)).scalar()
 
         return {
             "id": self.id,
@@ -66,17 +62,28 @@ class MainCategory(BaseModel):
 
 
 class Revision(BaseModel):
+    """
+    A single edit of a page by a contributor, stored once per main category.
+
+    Every index is a covering index of a hot query, checked by DatabaseManager.check_query_plans.
+    Each one starts with one of the foreign keys, so deletes cascade without the single-column
+    foreign key indexes, which would only slow down the inserts of a crawl.
+    """
     id = IntegerField(primary_key=True)
-    main_category = ForeignKeyField(MainCategory, backref='revisions', on_delete='CASCADE')
-    page = ForeignKeyField(Page, backref='revisions', on_delete='CASCADE')
-    contributor = ForeignKeyField(Contributor, backref='revisions', on_delete='CASCADE')
+    main_category = ForeignKeyField(MainCategory, backref='revisions', on_delete='CASCADE', index=False)
+    page = ForeignKeyField(Page, backref='revisions', on_delete='CASCADE', index=False)
+    contributor = ForeignKeyField(Contributor, backref='revisions', on_delete='CASCADE', index=False)
     timestamp = DateTimeField(default=datetime.utcnow)
+    timestamp_epoch = IntegerField(null=True)  # timestamp in seconds since the epoch, for range scans
 
     class Meta:
         indexes = (
-            (('id', 'main_category'), True),
-            (('contributor', 'main_category'), False),
-            (('page', 'main_category'), False),
+            # Time span of a (page, contributor) pair when a revision is deleted, newest revision per page
+            (('page', 'main_category', 'contributor', 'timestamp'), False),
+            # Activity of selected contributors
+            (('contributor', 'main_category', 'timestamp_epoch', 'page'), False),
+            # Time windows of a main category
+            (('main_category', 'timestamp_epoch', 'page', 'contributor'), False),
         )
 
     def to_dict(self):
@@ -88,12 +95,74 @@ class Revision(BaseModel):
             "timestamp": self.timestamp,
         }
 
+class PageContributor(BaseModel):
+    """
+    Incidence of pages and contributors: how often and when a contributor edited a page of a main category.
+
+    One row per (main category, page, contributor), maintained by triggers on the revision table.
+    The primary key doubles as covering index for lookups by category and page, the other
+    indexes cover lookups by category and contributor, including their time span, and by page alone.
+    """
+    main_category = ForeignKeyField(MainCategory, backref='page_contributors', on_delete='CASCADE', index=False)
+    page = ForeignKeyField(Page, backref='page_contributors', on_delete='CASCADE', index=False)
+    contributor = ForeignKeyField(Contributor, backref='page_contributors', on_delete='CASCADE', index=False)
+    revisions = IntegerField()
+    first_timestamp = DateTimeField()
+    last_timestamp = DateTimeField()
+
+    class Meta:
+        primary_key = CompositeKey('main_category', 'page', 'contributor')
+        without_rowid = True
+        indexes = (
+            (('main_category', 'contributor', 'page', 'revisions', 'first_timestamp', 'last_timestamp'), False),
+            (('page', 'contributor', 'revisions'), False),
+        )
+
+class ActivityMonth(BaseModel):
+    """Rollup of the revisions of a main category in one month ('YYYY-MM'), maintained by triggers."""
+    main_category = ForeignKeyField(MainCategory, backref='activity_months', on_delete='CASCADE', index=False)
+    month = CharField()
+    revisions = IntegerField()
+    unique_pages = IntegerField()
+    unique_contributors = IntegerField()
+
+    class Meta:
+        primary_key = CompositeKey('main_category', 'month')
+        without_rowid = True
+
+class ActivityMonthPage(BaseModel):
+    """Exact set of the pages edited in a month, lets coarser periods count distinct pages correctly."""
+    main_category = ForeignKeyField(MainCategory, on_delete='CASCADE', index=False)
+    month = CharField()
+    page = ForeignKeyField(Page, on_delete='CASCADE', index=False)
+    revisions = IntegerField()
+
+    class Meta:
+        primary_key = CompositeKey('main_category', 'month', 'page')
+        without_rowid = True
+
+class ActivityMonthContributor(BaseModel):
+    """Exact set of the contributors active in a month, lets coarser periods count distinct contributors correctly."""
+    main_category = ForeignKeyField(MainCategory, on_delete='CASCADE', index=False)
+    month = CharField()
+    contributor = ForeignKeyField(Contributor, on_delete='CASCADE', index=False)
+    revisions = IntegerField()
+
+    class Meta:
+        primary_key = CompositeKey('main_category', 'month', 'contributor')
+        without_rowid = True
+
 class Crawls(BaseModel):
     id = IntegerField(primary_key=True)
     main_category = ForeignKeyField(MainCategory, backref='crawls', on_delete='CASCADE')
     depth = IntegerField()
     start_time = DateTimeField()
-    end_time = DateTimeField()
+    end_time = DateTimeField(null=True)
+    status = CharField(default='completed')  # 'running' until the crawl has finished
+    incremental = BooleanField(default=False)
+    fetched_pages = IntegerField(null=True)  # for incremental crawls these two are the delta since the last crawl
+    fetched_revisions = IntegerField(null=True)
+    duplicate_pages = IntegerField(null=True)  # page fetches saved because the page was already fetched by this crawl
 
     def to_dict(self):
         return {
@@ -102,4 +171,41 @@ class Crawls(BaseModel):
             "depth": self.depth,
             "start_time": self.start_time,
             "end_time": self.end_time,
+            "status": self.status,
+            "incremental": self.incremental,
+            "fetched_pages": self.fetched_pages,
+            "fetched_revisions": self.fetched_revisions,
+            "duplicate_pages": self.duplicate_pages,
         }
+
+class CategoryLink(BaseModel):
+    """Edge of the cached subcategory DAG of a main category, depth is the distance of child from the main category."""
+    id = IntegerField(primary_key=True)
+    main_category = ForeignKeyField(MainCategory, backref='category_links', on_delete='CASCADE')
+    parent = CharField(null=False)
+    child = CharField(null=False)
+    depth = IntegerField()
+
+class CrawlCategory(BaseModel):
+    """Checkpoint: a category in the frontier of a crawl and whether all of its pages are stored."""
+    id = IntegerField(primary_key=True)
+    crawl = ForeignKeyField(Crawls, backref='categories', on_delete='CASCADE')
+    name = CharField(null=False)
+    depth = IntegerField()
+    completed = BooleanField(default=False)
+
+    class Meta:
+        indexes = (
+            (('crawl', 'name'), True),
+        )
+
+class CrawlPage(BaseModel):
+    """Checkpoint: a page whose complete revision history has been stored by a crawl."""
+    id = IntegerField(primary_key=True)
+    crawl = ForeignKeyField(Crawls, backref='pages', on_delete='CASCADE')
+    page_id = IntegerField()
+
+    class Meta:
+        indexes = (
+            (('crawl', 'page_id'), True),
+        )
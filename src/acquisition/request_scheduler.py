@@ -0,0 +1,227 @@
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying: rate limited, or a temporary server side problem
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class RequestScheduler:
+    """
+    Schedules the HTTP requests of the crawler.
+
+    - Paces requests to at most requests_per_second.
+    - Limits the requests in flight to an adaptive concurrency limit. The limit is halved when
+      the server throttles or fails, and raised by one after a window of successful requests
+      whose latency stays close to the best latency seen so far.
+    - Retries throttled and failed requests with jittered exponential backoff. A Retry-After
+      header from a 429/503 or a maxlag error pauses all requests for the given time.
+    - Records metrics: queue depth, requests in flight, p50/p95 latency, retries and errors.
+    """
+
+    def __init__(self, requests_per_second=None, max_concurrency=8, max_retries=8, backoff_base=0.5,
+                 backoff_max=60.0, maxlag=5, latency_tolerance=2.0):
+        """
+        Args:
+            requests_per_second: Target request rate, None for no pacing
+            max_concurrency: Upper bound for the adaptive concurrency limit
+            max_retries: Retries per request before the last response or error is passed on
+            backoff_base: Backoff in seconds before the first retry, doubled for every further retry
+            backoff_max: Upper bound for a single backoff
+            maxlag: maxlag parameter sent with every API request, None to not send it
+            latency_tolerance: The concurrency limit only grows while the median latency stays below
+                latency_tolerance times the lowest latency observed
+        """
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.maxlag = maxlag
+        self.latency_tolerance = latency_tolerance
+
+        self.concurrency_limit = max_concurrency
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._next_request_time = 0.0
+        self._paused_until = 0.0
+        self._successes_in_window = 0
+
+        self._latencies = deque(maxlen=1000)
+        self._min_latency = None
+        self._started = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+
+    def execute(self, send):
+        """
+        Run send() under the rate and concurrency limits and retry it if necessary.
+
+        Args:
+            send: Callable performing one HTTP request and returning a requests.Response
+
+        Returns:
+            The first successful response, or the last response once the retries are used up
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            start = time.monotonic()
+            response, error = None, None
+            try:
+                response = send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            finally:
+                latency = time.monotonic() - start
+                self._release()
+
+            delay = self._retry_delay(response, error)
+            if delay is None:
+                self._record_success(latency)
+                return response
+
+            self._record_failure(response)
+            if attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None:
+                response.content  # read the body, so the connection goes back to the pool
+                response.close()
+            with self._condition:
+                self.retries += 1
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+            time.sleep(max(delay, random.uniform(0, backoff)))
+
+    def get_metrics(self):
+        """Snapshot of the scheduler state and counters, latencies in seconds."""
+        with self._condition:
+            latencies = sorted(self._latencies)
+            elapsed = time.monotonic() - self._started
+            return {
+                'queue_depth': self._waiting,
+                'in_flight': self._in_flight,
+                'concurrency_limit': self.concurrency_limit,
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'requests_per_second': self.requests / elapsed if elapsed else 0.0,
+                'latency_p50': latencies[len(latencies) // 2] if latencies else None,
+                'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else None,
+            }
+
+    def _acquire(self):
+        with self._condition:
+            self._waiting += 1
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                elif self._in_flight >= self.concurrency_limit:
+                    self._condition.wait()
+                else:
+                    break
+            self._waiting -= 1
+            self._in_flight += 1
+
+            # Reserve the next free slot of the request rate, the wait itself happens outside the lock
+            wait = 0.0
+            if self.requests_per_second:
+                slot = max(now, self._next_request_time)
+                self._next_request_time = slot + 1 / self.requests_per_second
+                wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self.requests += 1
+            self._condition.notify_all()
+
+    def _retry_delay(self, response, error):
+        """Seconds to wait before retrying, 0 for the regular backoff and None if no retry is needed."""
+        if error is not None:
+            return 0.0
+        throttled = response.status_code in RETRY_STATUS_CODES or response.headers.get('MediaWiki-API-Error') == 'maxlag'
+        if not throttled:
+            return None
+
+        retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after:
+            with self._condition:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        return retry_after or 0.0
+
+    def _record_success(self, latency):
+        with self._condition:
+            self._latencies.append(latency)
+            self._min_latency = latency if self._min_latency is None else min(self._min_latency, latency)
+
+            # Additive increase, once per window of concurrency_limit successful requests
+            self._successes_in_window += 1
+            if self._successes_in_window >= self.concurrency_limit:
+                self._successes_in_window = 0
+                recent = sorted(list(self._latencies)[-self.concurrency_limit:])
+                median = recent[len(recent) // 2]
+                if median <= self.latency_tolerance * self._min_latency:
+                    self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1)
+                elif self.concurrency_limit > 1:
+                    self.concurrency_limit -= 1
+                self._condition.notify_all()
+
+    def _record_failure(self, response):
+        with self._condition:
+            if response is None or response.status_code >= 500:
+                self.errors += 1
+            else:
+                self.throttled += 1
+            # Multiplicative decrease
+            self.concurrency_limit = max(1, self.concurrency_limit // 2)
+            self._successes_in_window = 0
+
+
+class ScheduledHTTPAdapter(HTTPAdapter):
+    """Transport adapter sending every request of a requests.Session through a RequestScheduler."""
+
+    def __init__(self, scheduler, **kwargs):
+        self.scheduler = scheduler
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.scheduler.maxlag is not None and '/api.php' in request.url:
+            _add_maxlag(request, self.scheduler.maxlag)
+        return self.scheduler.execute(lambda: super(ScheduledHTTPAdapter, self).send(request, **kwargs))
+
+
+def _add_maxlag(request, maxlag):
+    """Ask the API to refuse the request while replication lag exceeds maxlag seconds."""
+    if request.method == 'GET':
+        if 'maxlag=' not in request.url:
+            request.prepare_url(request.url, {'maxlag': maxlag})
+    elif isinstance(request.body, str) and 'maxlag=' not in request.body:
+        request.body += f'&maxlag={maxlag}'
+        request.headers['Content-Length'] = str(len(request.body.encode()))
+
+
+def _parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,92 +1,406 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from itertools import islice
 import mwclient
 from tqdm import tqdm
+from src.acquisition.crawl_pipeline import CrawlPipeline
+from src.acquisition.http_cache import RecordReplayAdapter
+from src.acquisition.request_scheduler import RequestScheduler, ScheduledHTTPAdapter
+
+# Largest rvlimit the API grants to clients without the apihighlimits right
+REVISIONS_PER_REQUEST = 500
+# Largest number of titles per query for clients without the apihighlimits right
+CATEGORIES_PER_REQUEST = 50
 
 class WikipediaCategoryCrawler():
-    def __init__(self, main_category, db_manager):
-        self.site = mwclient.Site('en.wikipedia.org')
+    def __init__(self, main_category, db_manager, max_workers=1, site=None, scheduler=None, http_cache=None,
+                 http_cache_mode='replay', queue_size=64):
+        """
+        Args:
+            main_category: Name of the root category to crawl
+            db_manager: DatabaseManager the crawled data is written to
+            max_workers: Number of pages whose revisions are fetched concurrently
+            site: Optional mwclient.Site to crawl instead of en.wikipedia.org, e.g. a local stand-in.
+                A site created with do_init=False is initialized through the scheduler and cache.
+            scheduler: Optional RequestScheduler for rate limit, retries and adaptive concurrency,
+                by default one with max_workers as maximal concurrency and no rate limit
+            http_cache: Optional directory of a record/replay cache of the API responses
+            http_cache_mode: 'record' to store the responses of a live crawl in http_cache, 'replay' to
+                crawl offline from http_cache only, 'auto' to replay cached and record missing responses
+            queue_size: Number of revision batches the fetch workers may run ahead of the database writes
+        """
+        self.scheduler = scheduler or RequestScheduler(max_concurrency=max_workers)
+        if site is None:
+            site = mwclient.Site('en.wikipedia.org', do_init=False)
+
+        # Every API request goes through the scheduler. requests keeps at most 10 connections
+        # per host by default, one per worker is needed.
+        adapter = ScheduledHTTPAdapter(self.scheduler, pool_maxsize=max(max_workers, 10))
+        self.http_cache = None
+        if http_cache is not None:
+            # The cache sits in front of the scheduler, replayed responses are served without any pacing
+            adapter = self.http_cache = RecordReplayAdapter(http_cache, mode=http_cache_mode, adapter=adapter)
+        site.connection.mount(f'{site.scheme}://', adapter)
+        if not site.initialized:
+            site.site_init()
+
+        self.site = site
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.pipeline_stats = []  # stage throughput of every pipeline run
         self.visited_categories = set()
-        self.pages = set()
+        self.pages = set()  # ids of all pages listed by this run of the crawl
+        self.completed_pages = set()  # ids of the pages stored by earlier runs of a resumed crawl
+        self.resumed_pages = 0
         self.contributors = set()
         self.contributions = set()
 
         self.main_category = main_category
         self.db_manager = db_manager
+        self.crawl_id = None
+        self.incremental = False
+        self.last_revision_ids = {}
+        self.page_categories = {}  # category every page of the crawl is fetched for
+        self.category_stats = {}
+        self.remaining_pages = {}  # pages of every category not written yet
+        self.failed_pages = {}  # page id -> error of the pages whose fetch failed
 
-    def get_categories(self, depth=3):
+    def get_categories(self, depth=3, use_cache=True):
+        """
+        Get all subcategories down to the given depth as (name, depth) tuples in breadth-first order.
 
-        def get_subcategories(category, current_depth):
-            if current_depth > depth or category in self.visited_categories:
-                return []
-            
-            self.visited_categories.add(category)
-            cat = self.site.categories[category]
-            subcats = []
+        The subcategory DAG is cached in the database, so later crawls of the same main category
+        reuse it instead of discovering it again, unless use_cache is False.
+        """
+        edges = self.db_manager.get_category_dag(self.main_category_id, depth) if use_cache else None
+        if edges is None:
+            edges = self.discover_categories(depth)
+            self.db_manager.save_category_dag(self.main_category_id, depth, edges)
+        else:
+            print(f'Using cached subcategories of {self.main_category}')
 
-            for subcat in cat:
-                if subcat.namespace == 14: # a namespace of 14 indicates a category, see reference below
-                    subcat_name = subcat.name.replace('Category:', '')
-                    subcats.append(subcat_name)
-                    if current_depth < depth:
-                        subcats.extend(get_subcategories(subcat_name, current_depth + 1))
+        all_subcategories = {}
+        for parent, child, child_depth in edges:
+            all_subcategories.setdefault(child, child_depth)
+            if child_depth < depth:
+                self.visited_categories.add(child)
+        all_subcategories.pop(self.main_category, None)
+        self.visited_categories.add(self.main_category)
 
-            return subcats
-
-        all_subcategories = get_subcategories(self.main_category, 1)
-        
         print()
         print(f'Number of Subcategories: {len(all_subcategories)}')
+        return sorted(all_subcategories.items(), key=lambda item: item[1])
+
+    def discover_categories(self, depth=3):
+        """
+        Discover the subcategory DAG of the main category breadth-first, level by level.
+
+        Each category is expanded only once, even if it is reachable through several parents.
+        For every level, one categoryinfo query per 50 categories finds the ones that have
+        subcategories at all, and only those are listed, concurrently with max_workers threads.
+
+        Returns:
+            List of (parent, child, child_depth) edges, child_depth being the shortest
+            distance of child from the main category
+        """
+        depths = {self.main_category: 0}
+        edges = []
+        frontier = [self.main_category]
+
+        for level in range(1, depth + 1):
+            expandable = self.get_categories_with_subcategories(frontier)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                listings = list(executor.map(self.get_subcategory_names, expandable))
+
+            frontier = []
+            for parent, children in zip(expandable, listings):
+                for child in children:
+                    if child not in depths:
+                        depths[child] = level
+                        frontier.append(child)
+                    edges.append((parent, child, depths[child]))
+
+            print(f'Depth {level}: {len(frontier)} new subcategories')
 
-        for idx, subcategory in enumerate(all_subcategories, start=1):
-            print(f'Subcategory {idx}/{len(all_subcategories)}: {subcategory}')
-            self.get_category_pages(subcategory)
-            
+        return edges
+
+    def get_categories_with_subcategories(self, categories):
+        """Filter categories down to those with at least one subcategory, 50 titles per request."""
+        expandable = []
+        for idx in range(0, len(categories), CATEGORIES_PER_REQUEST):
+            batch = categories[idx:idx + CATEGORIES_PER_REQUEST]
+            response = self.site.get('query', prop='categoryinfo', titles='|'.join(f'Category:{name}' for name in batch))
+
+            # Titles can come back normalized, e.g. with the first letter capitalized
+            normalized = {item['to']: item['from'] for item in response['query'].get('normalized', [])}
+            subcategory_counts = {}
+            for info in response['query']['pages'].values():
+                title = normalized.get(info['title'], info['title'])
+                subcategory_counts[title.replace('Category:', '', 1)] = info.get('categoryinfo', {}).get('subcats', 0)
+
+            expandable.extend(name for name in batch if subcategory_counts.get(name, 0) > 0)
+        return expandable
+
+    def get_subcategory_names(self, category):
+        """List the direct subcategories of a category, without any of its pages."""
+        members = mwclient.listing.List(self.site, 'categorymembers', 'cm',
+                                        cmtitle=f'Category:{category}', cmtype='subcat', cmprop='title')
+        return [member['title'].replace('Category:', '', 1) for member in members]
 
     def get_category_pages(self, category):
+        """List the articles of a category, the pages in namespace 0."""
         cat = self.site.categories[category]
+        return [page for page in cat if page.namespace == 0]
 
-        pages = [page for page in cat if page.namespace == 0]  # Collect only pages in namespace 0, which corespond to articles
-        print()
-        print(f"Number of pages in category '{category}': {len(pages)}")
+    def crawl_categories(self, categories):
+        """
+        Fetch the pages of all categories in one pipeline, without waiting for a category to finish
+        before the next one starts. The categories are listed concurrently up front, and each is
+        checkpointed as soon as the last of its pages has been written.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            listings = list(executor.map(self.get_category_pages, categories))
+
+        pages = []
+        self.category_stats = {}
+        self.remaining_pages = {}
+        for category, category_pages in zip(categories, listings):
+            print(f"Number of pages in category '{category}': {len(category_pages)}")
+
+            # A page filed under several subcategories is fetched only once per crawl, for the first
+            # of them. Pages stored by an earlier run of a resumed crawl are skipped as well, but they
+            # are no duplicates
+            duplicates = [page for page in category_pages if page.pageid in self.pages]
+            category_pages = [page for page in category_pages if page.pageid not in self.pages]
+            self.pages.update(page.pageid for page in category_pages)
+            resumed = [page for page in category_pages if page.pageid in self.completed_pages]
+            category_pages = [page for page in category_pages if page.pageid not in self.completed_pages]
+            self.resumed_pages += len(resumed)
+            if duplicates:
+                print(f"Pages already fetched by this crawl: {len(duplicates)}")
+            if resumed:
+                print(f"Pages stored by an earlier run of this crawl: {len(resumed)}")
+
+            if self.incremental:
+                # The category listing already carries the newest revision id of every page,
+                # pages without revisions newer than the stored ones need no request at all
+                unchanged = [page for page in category_pages if self.last_revision_ids.get(page.pageid, 0) >= page.revision]
+                for page in unchanged:
+                    self.db_manager.add_completed_page(self.crawl_id, page.pageid)
+                category_pages = [page for page in category_pages if self.last_revision_ids.get(page.pageid, 0) < page.revision]
+                print(f"Unchanged pages skipped: {len(unchanged)}")
+
+            self.category_stats[category] = {'fetched_pages': 0, 'fetched_revisions': 0, 'duplicate_pages': len(duplicates)}
+            self.remaining_pages[category] = len(category_pages)
+            for page in category_pages:
+                self.page_categories[page.pageid] = category
+            pages.extend(category_pages)
+            if not category_pages:
+                self.complete_category(category)
 
-        for page in tqdm(pages, desc="Processing Pages", unit="page"):
-            tmp_page = self.db_manager.get_or_create_page(page_id=page.pageid, page_name=page.name)
+        # Up to max_workers threads fetch the revisions while this thread writes them, the bounded
+        # queue in between keeps the fetches at most queue_size batches ahead of the writes
+        progress = tqdm(total=len(pages), desc="Processing Pages", unit="page")
 
-            for revision in list(page.revisions()):
-                if 'user' in revision:
-                    tmp_contributor = self.db_manager.get_or_create_contributor(username=revision['user'])
-                else:
-                    tmp_contributor = self.db_manager.get_or_create_contributor(username="Unknown")
+        def update_progress():
+            progress.update()
+            progress.set_postfix(self.get_request_metrics(), refresh=False)
 
-                timestamp_struct = revision['timestamp']
-                timestamp_obj = datetime(*timestamp_struct[:6], tzinfo=timezone.utc)  # Convert struct_time to datetime
-                formatted_timestamp = timestamp_obj.strftime('%Y-%m-%dT%H:%M:%SZ')
+        pipeline = CrawlPipeline(self.iter_revision_batches, self.store_revisions, self.complete_page,
+                                 max_workers=self.max_workers, queue_size=self.queue_size, fail=self.fail_page)
+        try:
+            pipeline.run(pages, progress=update_progress)
+            # Categories with failed pages stay unfinished, only what was fetched for them is counted.
+            # Their duplicates are counted when a resumed run lists them again and completes them
+            for category, remaining in self.remaining_pages.items():
+                if remaining:
+                    stats = self.category_stats[category]
+                    self.db_manager.add_crawl_counts(self.crawl_id, stats['fetched_pages'], stats['fetched_revisions'])
+        finally:
+            progress.close()
+            self.db_manager.flush()
+            self.pipeline_stats.append(pipeline.get_stats())
 
-                self.db_manager.create_revision(
-                    revision_id=revision['revid'],
-                    page=tmp_page,
-                    contributor=tmp_contributor,
-                    timestamp=formatted_timestamp,
-                    main_category_id=self.main_category_id
-                )
+    def fail_page(self, page, error):
+        """
+        Record a page whose revisions could not be fetched. The revisions stored so far are the oldest
+        ones of the page, but neither the page nor its category are checkpointed, so resuming the crawl
+        fetches the rest of the page.
+        """
+        self.failed_pages[page.pageid] = f"{type(error).__name__}: {error}"
+        print(f"Failed to fetch page '{page.name}' ({page.pageid}): {self.failed_pages[page.pageid]}")
 
-    def get_pages_and_contributions(self):
-        self.get_category_pages(self.main_category)
+    def complete_category(self, category):
+        """Checkpoint a category together with the pages and revisions fetched for it."""
+        stats = self.category_stats[category]
+        self.db_manager.complete_crawl_category(self.crawl_id, category, stats['fetched_pages'],
+                                                stats['fetched_revisions'], stats['duplicate_pages'])
 
-    def crawl_category(self, depth=3):
+    def get_pipeline_stats(self):
+        """
+        Throughput of the fetch and the write stage summed over all pipeline runs of the crawl.
+
+        A fetch stage blocked on a full queue means the writes are the bottleneck, an idle
+        write stage means the fetches are.
+        """
+        fetch_seconds = sum(stats['fetched_records'] / stats['fetch_records_per_second']
+                            for stats in self.pipeline_stats if stats['fetch_records_per_second'])
+        write_seconds = sum(stats['written_records'] / stats['write_records_per_second']
+                            for stats in self.pipeline_stats if stats['write_records_per_second'])
+        fetched = sum(stats['fetched_records'] for stats in self.pipeline_stats)
+        written = sum(stats['written_records'] for stats in self.pipeline_stats)
+        return {
+            'fetched_records': fetched,
+            'fetch_records_per_second': fetched / fetch_seconds if fetch_seconds else 0.0,
+            'fetch_blocked_seconds': sum(stats['fetch_blocked_seconds'] for stats in self.pipeline_stats),
+            'written_records': written,
+            'write_records_per_second': written / write_seconds if write_seconds else 0.0,
+            'write_idle_seconds': sum(stats['write_idle_seconds'] for stats in self.pipeline_stats),
+        }
+
+    def get_request_metrics(self):
+        """Condensed live metrics of the request scheduler for the progress bar."""
+        metrics = self.scheduler.get_metrics()
+        return {
+            'queue': metrics['queue_depth'],
+            'limit': metrics['concurrency_limit'],
+            'p50': f"{metrics['latency_p50'] or 0:.2f}s",
+            'p95': f"{metrics['latency_p95'] or 0:.2f}s",
+            'retries': metrics['retries'],
+        }
+
+    def iter_revisions(self, page):
+        """
+        Stream the revision history of a page as (revision_id, username, timestamp) tuples.
+
+        Only the properties that are stored are requested, with the largest batch size the API
+        allows. The revisions come oldest first, so the revisions stored before a fetch fails are
+        the beginning of the history, and only revisions newer than the newest stored one are
+        requested when the page is fetched again.
+        """
+        kwargs = {'prop': 'ids|user|timestamp', 'api_chunk_size': REVISIONS_PER_REQUEST, 'dir': 'newer'}
+        last_revision_id = self.last_revision_ids.get(page.pageid)
+        if last_revision_id:
+            # rvstartid has to name an existing revision of the page, revision ids are global and sparse.
+            # The listing starts at the stored revision, which is dropped here.
+            kwargs['startid'] = last_revision_id
+
+        for revision in page.revisions(**kwargs):
+            if last_revision_id and revision['revid'] <= last_revision_id:
+                continue
+            username = revision['user'] if 'user' in revision else "Unknown"
+
+            timestamp_struct = revision['timestamp']
+            timestamp_obj = datetime(*timestamp_struct[:6], tzinfo=timezone.utc)  # Convert struct_time to datetime
+            formatted_timestamp = timestamp_obj.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+            yield revision['revid'], username, formatted_timestamp
+
+    def iter_revision_batches(self, page):
+        """Group the revision stream of a page into batches of one API response each, used by the fetch workers."""
+        revisions = self.iter_revisions(page)
+        while True:
+            batch = list(islice(revisions, REVISIONS_PER_REQUEST))
+            if not batch:
+                return
+            yield batch
+
+    def store_revisions(self, page, revisions):
+        """Buffer a batch of revisions of a page, given as list or as stream, written with the next flush."""
+        revisions = list(revisions)
+        self.db_manager.add_page(page_id=page.pageid, page_name=page.name)
+        self.db_manager.add_page_revisions(page.pageid, revisions, self.main_category_id)
+        if self.incremental and revisions:
+            self.last_revision_ids[page.pageid] = max(self.last_revision_ids.get(page.pageid, 0),
+                                                      max(revision_id for revision_id, _, _ in revisions))
+        self.category_stats[self.page_categories[page.pageid]]['fetched_revisions'] += len(revisions)
+
+    def complete_page(self, page):
+        """Checkpoint a page after all of its revisions have been buffered, and its category after its last page."""
+        self.db_manager.add_page(page_id=page.pageid, page_name=page.name)
+        self.db_manager.add_completed_page(self.crawl_id, page.pageid)
+
+        category = self.page_categories[page.pageid]
+        self.category_stats[category]['fetched_pages'] += 1
+        self.remaining_pages[category] -= 1
+        if not self.remaining_pages[category]:
+            self.complete_category(category)
+
+    def crawl_category(self, depth=3, resume=False, incremental=False, refresh_categories=False):
+        """
+        Crawl the main category and its subcategories down to the given depth.
+
+        The category frontier and every stored page are checkpointed in the database. With
+        resume=True the most recent unfinished crawl of the main category is continued instead,
+        skipping the category discovery as well as all completed categories and pages.
+
+        With incremental=True only revisions newer than the newest stored revision of each page
+        are fetched and pages without new revisions are skipped, which refreshes an already
+        crawled category. The number of fetched pages and revisions is recorded in the crawl.
+
+        The revisions of a page are written oldest first while it is fetched, the page itself is only
+        checkpointed once all of them are stored. A page whose fetch fails keeps the revisions stored so
+        far and the other pages go on. The crawl is then left unfinished, and resume=True fetches the
+        rest of the failed pages.
+
+        The subcategories are taken from the cached category DAG of earlier crawls if it is deep
+        enough, refresh_categories=True discovers them again.
+        """
         start_time = datetime.now(timezone.utc)
         self.main_category_id = self.db_manager.get_or_create_main_category(self.main_category)
 
-        self.get_categories(depth)
-        self.get_pages_and_contributions()
+        crawl = self.db_manager.get_resumable_crawl(self.main_category_id) if resume else None
+        resumed = crawl is not None
+        if crawl is None:
+            crawl = self.db_manager.create_crawl(main_category=self.main_category_id, depth=depth,
+                                                 start_time=start_time, incremental=incremental)
+        else:
+            print(f"Resuming crawl {crawl.id} of '{self.main_category}' started at {crawl.start_time}")
+        self.crawl_id = crawl.id
+        self.completed_pages = self.db_manager.get_completed_pages(self.crawl_id)
+        self.incremental = crawl.incremental
+        # A page an interrupted run stored only partly is continued after its newest stored revision
+        self.last_revision_ids = self.db_manager.get_last_revision_ids() if self.incremental or resumed else {}
+
+        categories = self.db_manager.get_crawl_categories(self.crawl_id)
+        if not categories:
+            subcategories = self.get_categories(crawl.depth, use_cache=not refresh_categories)
+            self.db_manager.save_crawl_categories(self.crawl_id, subcategories + [(self.main_category, 0)])
+            self.db_manager.update_main_category(self.main_category_id, len(self.visited_categories))
+            categories = self.db_manager.get_crawl_categories(self.crawl_id)
 
+        pending = [name for name, _, completed in categories if not completed]
+        print(f'Categories left to crawl: {len(pending)}/{len(categories)}, pages already stored: {len(self.completed_pages)}')
 
-        end_time = datetime.now(timezone.utc)
-        self.db_manager.create_crawl(
-            main_category=self.main_category_id,
-            depth=depth,
-            start_time=start_time,
-            end_time=end_time
-        )
+        self.crawl_categories(pending)
+
+        crawl = self.db_manager.get_crawl(self.crawl_id)
+        print()
+        print(f"Pages fetched: {crawl.fetched_pages}, revisions fetched: {crawl.fetched_revisions}")
+        print(f"Page fetches saved by de-duplication: {crawl.duplicate_pages}")
+        if self.resumed_pages:
+            print(f"Pages skipped because an earlier run of the crawl stored them: {self.resumed_pages}")
+        request_metrics = self.scheduler.get_metrics()
+        print(f"Requests: {request_metrics['requests']} ({request_metrics['requests_per_second']:.1f}/s), "
+              f"retries: {request_metrics['retries']}, throttled: {request_metrics['throttled']}, errors: {request_metrics['errors']}")
+        if self.http_cache is not None:
+            cache_stats = self.http_cache.stats()
+            print(f"HTTP cache ({self.http_cache.mode}): {cache_stats['hits']} replayed, {cache_stats['recorded']} recorded")
+        pipeline_stats = self.get_pipeline_stats()
+        print(f"Fetch stage: {pipeline_stats['fetched_records']} revisions ({pipeline_stats['fetch_records_per_second']:.0f}/s), "
+              f"blocked on a full queue for {pipeline_stats['fetch_blocked_seconds']:.2f}s")
+        print(f"Write stage: {pipeline_stats['written_records']} revisions ({pipeline_stats['write_records_per_second']:.0f}/s), "
+              f"idle waiting for fetches for {pipeline_stats['write_idle_seconds']:.2f}s")
+        write_stats = self.db_manager.get_write_stats()
+        print(f"Rows written: {write_stats['rows']} in {write_stats['seconds']:.2f}s ({write_stats['rows_per_second']:.0f} rows/s)")
+        contributor_cache = self.db_manager.get_cache_stats()['contributors']
+        print(f"Contributor cache: {contributor_cache['hits']} hits, {contributor_cache['misses']} misses")
 
-        self.db_manager.update_main_category(self.main_category_id, len(self.visited_categories))
\ No newline at end of file
+        if self.failed_pages:
+            # Their categories are not checkpointed, the crawl stays resumable to fetch them again
+            print(f"Pages that failed: {len(self.failed_pages)}, run crawl_category(resume=True) to fetch them again")
+        else:
+            end_time = datetime.now(timezone.utc)
+            self.db_manager.finish_crawl(self.crawl_id, end_time)
+        # The new revisions change the index statistics the planner relies on
+        self.db_manager.update_statistics()
\ No newline at end of file
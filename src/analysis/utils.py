@@ -14,16 +14,31 @@ def get_node_ids_from_community(G, communities, target_community_id):
     return nodes_in_community
 
 def plot_stats_for_category_quarterly(df, category_name):
-    # Add a 'quarter' column based on the 'month'
-    df['quarter'] = df['month'].dt.to_period('Q')
-
+    """
+    Plot the quarterly number of revisions, unique pages and unique contributors.
+
+    Args:
+        df: Quarterly stats from DatabaseManager.get_activity_stats(main_category_id, period='quarter').
+            Unique counts of months cannot be summed up to quarters, a page edited in two months
+            of a quarter would be counted twice, so monthly stats are rejected.
+        category_name: Name shown in the title
+    """
+    if 'quarter' not in df.columns:
+        raise ValueError("df must hold quarterly stats, use db_manager.get_activity_stats(main_category_id, period='quarter')")
+
+    quarterly_df = df.copy()
+    quarterly_df['quarter'] = pd.to_datetime(quarterly_df['quarter']).dt.to_period('Q')
+
+    # Quarters without any revision are shown as 0
+    all_quarters = pd.period_range(start=quarterly_df['quarter'].min(), end=quarterly_df['quarter'].max(), freq='Q')
     quarterly_df = (
-        df.groupby('quarter')[['total_contributions', 'unique_pages', 'unique_contributors']]
-        .sum()
+        quarterly_df
+        .set_index('quarter')[['total_contributions', 'unique_pages', 'unique_contributors']]
+        .reindex(all_quarters, fill_value=0)
+        .rename_axis('quarter')
         .reset_index()
     )
 
-    # Convert the 'quarter' back to a string for plotting
     quarterly_df['quarter'] = quarterly_df['quarter'].astype(str)
 
     plt.figure(figsize=(10, 6))
@@ -42,51 +57,3 @@ def plot_stats_for_category_quarterly(df, category_name):
 
     plt.tight_layout()
     plt.show()
-
-def plot_stats_for_category_quarterly(df, category_name):
-        if not pd.api.types.is_datetime64_any_dtype(df['month']):
-                df['month'] = pd.to_datetime(df['month'])
-
-        df['quarter'] = df['month'].dt.to_period('Q')
-
-        min_quarter = df['quarter'].min()
-        max_quarter = df['quarter'].max()
-        all_quarters = pd.period_range(start=min_quarter, end=max_quarter, freq='Q')
-
-        complete_quarters_df = pd.DataFrame(index=all_quarters)
-        complete_quarters_df.index.name = 'quarter'
-
-        quarterly_df = (
-                df.groupby('quarter')[['total_contributions', 'unique_pages', 'unique_contributors']]
-                .sum()
-        )
-
-        quarterly_df = (
-                complete_quarters_df
-                .join(quarterly_df)
-                .fillna(0)
-                .reset_index()
-        )
-
-        quarterly_df['quarter'] = quarterly_df['quarter'].astype(str)
-
-        plt.figure(figsize=(10, 6))
-        plt.plot(quarterly_df['quarter'], quarterly_df['unique_pages'], 
-                label='Unique Pages')
-        plt.plot(quarterly_df['quarter'], quarterly_df['unique_contributors'], 
-                label='Unique Contributors')
-        plt.plot(quarterly_df['quarter'], quarterly_df['total_contributions'], 
-                label='Total Contributions')
-
-        plt.title(f'Quarterly Statistics for Main Category: {category_name}')
-        plt.xlabel('Quarter')
-        plt.ylabel('Count')
-        plt.legend()
-        plt.grid(True)
-
-        xticks = quarterly_df['quarter'][::20]  
-        plt.xticks(ticks=range(0, len(quarterly_df['quarter']), 20), 
-                labels=xticks, rotation=45)
-
-        plt.tight_layout()
-        plt.show()
\ No newline at end of file
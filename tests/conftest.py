@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# The modules are imported as src.acquisition..., like in the notebooks and benchmarks
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.acquisition.models.db.database import db, initialize_db
+from src.acquisition.models.database_manager import DatabaseManager
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """DatabaseManager of a new SQLite database in a temporary directory."""
+    initialize_db(str(tmp_path / 'test.db'))
+    yield DatabaseManager(db)
+    db.close()
+
+
+@pytest.fixture
+def synthetic_category(db_manager):
+    """Id of a small synthetic main category with skewed page sizes, written through the buffered write path."""
+    from benchmarks.synthetic_db import populate_database
+
+    return populate_database(db_manager, pages=40, contributors=150, revisions=2000, seed=1)
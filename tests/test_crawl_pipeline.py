@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from src.acquisition.crawl_pipeline import CrawlPipeline
+
+
+class Writer:
+    """Records what the writer stage is handed, and by which thread."""
+
+    def __init__(self):
+        self.batches = {}
+        self.completed = []
+        self.failed = {}
+        self.threads = set()
+
+    def consume(self, item, batch):
+        self.threads.add(threading.get_ident())
+        assert item not in self.completed
+        self.batches.setdefault(item, []).extend(batch)
+
+    def complete(self, item):
+        self.threads.add(threading.get_ident())
+        self.completed.append(item)
+
+    def fail(self, item, error):
+        self.failed[item] = error
+
+
+def produce(item):
+    # Item n yields n records in batches of up to three, some items yield nothing
+    records = list(range(item))
+    for start in range(0, len(records), 3):
+        time.sleep(0.001)
+        yield records[start:start + 3]
+
+
+def test_every_item_is_written_and_completed_by_the_calling_thread():
+    writer = Writer()
+    pipeline = CrawlPipeline(produce, writer.consume, writer.complete, max_workers=4, queue_size=2)
+    pipeline.run(range(20))
+
+    assert sorted(writer.completed) == list(range(20))
+    assert writer.batches == {item: list(range(item)) for item in range(1, 20)}
+    assert writer.threads == {threading.get_ident()}
+    stats = pipeline.get_stats()
+    assert stats['written_records'] == stats['fetched_records'] == sum(range(20))
+    assert stats['max_queue_depth'] <= 2
+
+
+def test_a_failed_item_keeps_its_batches_and_the_others_go_on():
+    def flaky(item):
+        for number, batch in enumerate(produce(item)):
+            if item == 10 and number == 2:
+                raise ConnectionError('connection reset')
+            yield batch
+
+    writer = Writer()
+    pipeline = CrawlPipeline(flaky, writer.consume, writer.complete, max_workers=3, fail=writer.fail)
+    pipeline.run(range(12))
+
+    assert sorted(writer.completed) == [item for item in range(12) if item != 10]
+    assert list(writer.failed) == [10] and isinstance(writer.failed[10], ConnectionError)
+    assert writer.batches[10] == list(range(6))
+    assert pipeline.get_stats()['failed_items'] == 1
+
+
+def test_without_fail_the_first_error_stops_the_pipeline():
+    def broken(item):
+        raise ValueError(f'item {item}')
+        yield
+
+    writer = Writer()
+    with pytest.raises(ValueError):
+        CrawlPipeline(broken, writer.consume, writer.complete, max_workers=2).run(range(5))
+    assert not writer.completed
+
+
+def test_a_failing_writer_stops_the_blocked_workers():
+    def consume(item, batch):
+        raise RuntimeError('disk full')
+
+    with pytest.raises(RuntimeError):
+        CrawlPipeline(produce, consume, Writer().complete, max_workers=4, queue_size=1).run(range(50))
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+pytest.importorskip('graph_tool')
+
+from graph_tool.all import Graph
+
+from src.acquisition.graph_tool.contributor_graph_builder import ContributorGraphBuilder
+from src.acquisition.graph_tool.graph_cache import GraphCache
+
+
+def save_graph(path, vertices):
+    graph = Graph(directed=False)
+    graph.add_vertex(vertices)
+    graph.save(str(path))
+    return str(path)
+
+
+def test_key_does_not_depend_on_the_order_of_the_parts(tmp_path):
+    cache = GraphCache(str(tmp_path / 'cache'))
+    assert cache.key({'weighted': True, 'start': None}) == cache.key({'start': None, 'weighted': True})
+    assert cache.key({'weighted': True}) != cache.key({'weighted': False})
+
+
+def test_saved_graph_is_loaded_with_its_report(tmp_path):
+    cache = GraphCache(str(tmp_path / 'cache'))
+    key = cache.key({'graph': 1})
+    assert cache.load(key) is None
+
+    cache.save(key, save_graph(tmp_path / 'graph.gt', 5), parts={'graph': 1}, report={'edges': 7})
+    assert cache.load(key).num_vertices() == 5
+    assert cache.load_report(key) == {'edges': 7}
+
+
+def test_loading_leaves_the_graph_file_of_the_builder_alone(tmp_path):
+    cache = GraphCache(str(tmp_path / 'cache'))
+    graph_file = save_graph(tmp_path / 'graph.gt', 3)
+    key = cache.key({'graph': 1})
+    cache.save(key, graph_file)
+    os.utime(graph_file, (1000000000, 1000000000))
+
+    cache.load(key)
+    assert os.stat(graph_file).st_mtime == 1000000000
+
+
+def test_least_recently_used_graphs_are_evicted(tmp_path):
+    graph_files = [save_graph(tmp_path / f'graph{idx}.gt', 10) for idx in range(3)]
+    size = os.path.getsize(graph_files[0])
+    cache = GraphCache(str(tmp_path / 'cache'), max_bytes=2 * size)
+    keys = [cache.key({'graph': idx}) for idx in range(3)]
+    for idx, key in enumerate(keys[:2]):
+        cache.save(key, graph_files[idx])
+        os.utime(cache.metadata_path(key), (1000000000 + idx, 1000000000 + idx))
+
+    # The first graph is used again, so the second one is the least recently used
+    cache.load(keys[0])
+    cache.save(keys[2], graph_files[2])
+    assert [os.path.exists(cache.path(key)) for key in keys] == [True, False, True]
+    assert os.path.exists(graph_files[1])
+
+
+def test_unknown_category_is_rejected(db_manager):
+    with pytest.raises(ValueError, match='Nowhere'):
+        ContributorGraphBuilder(db_manager, 'Nowhere', cache=True)
+
+
+def test_builder_loads_an_unchanged_graph_from_the_cache(db_manager, synthetic_category, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('outputs/graphs')
+    cache = GraphCache(str(tmp_path / 'cache'))
+
+    built = ContributorGraphBuilder(db_manager, 'Synthetic', weighted=True, cache=cache).build()
+    builder = ContributorGraphBuilder(db_manager, 'Synthetic', weighted=True, engine='sql', cache=cache)
+    key = cache.key(builder.cache_key_parts())
+    capsys.readouterr()
+    loaded = builder.build()
+    assert f'Loaded cached graph {key[:12]}' in capsys.readouterr().out
+    assert sorted(os.listdir(cache.directory)) == [f'{key}.gt', f'{key}.json']
+    assert (loaded.num_vertices(), loaded.num_edges()) == (built.num_vertices(), built.num_edges())
+
+    # New revisions change the key, the graph is built again
+    db_manager.add_page(10 ** 6, 'New page')
+    db_manager.add_revision(10 ** 9, 10 ** 6, 'Newcomer', '2030-01-01T00:00:00Z', synthetic_category)
+    db_manager.flush()
+    assert cache.key(builder.cache_key_parts()) != key
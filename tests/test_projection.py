@@ -0,0 +1,85 @@
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from src.acquisition.graph_tool.projection import (
+    ProjectionOptions, iter_edge_runs, iter_projection_edges, load_incidence, project_out_of_core
+)
+
+
+def concatenate(chunks, columns):
+    chunks = list(chunks)
+    return np.concatenate(chunks) if chunks else np.empty((0, columns), dtype=np.int64)
+
+
+def reference_edges(db_manager, main_category_id, weighted):
+    """Pairs of contributors sharing a page, weighted by the larger of the revisions either made on the shared pages."""
+    revisions = defaultdict(dict)
+    for page_id, contributor_id, count in db_manager.db.execute_sql(
+            'SELECT page_id, contributor_id, revisions FROM pagecontributor WHERE main_category_id = ?', (main_category_id,)):
+        revisions[page_id][contributor_id] = count
+    directed = defaultdict(int)
+    for contributors in revisions.values():
+        for source, target in combinations(sorted(contributors), 2):
+            directed[source, target] += contributors[source]
+            directed[target, source] += contributors[target]
+    edges = sorted((source, target, max(weight, directed[target, source]))
+                   for (source, target), weight in directed.items() if source < target)
+    return np.array(edges, dtype=np.int64).reshape(-1, 3)[:, :3 if weighted else 2]
+
+
+def sql_edges(db_manager, main_category_id, weighted):
+    return concatenate(db_manager.iter_co_contribution_edges(main_category_id, weighted=weighted, chunk_size=500),
+                       3 if weighted else 2)
+
+
+def sparse_edges(incidence, weighted, options=None):
+    # Small blocks, so the edges come from many products
+    return concatenate(iter_projection_edges(incidence, weighted=weighted, max_block_pairs=500, options=options),
+                       3 if weighted else 2)
+
+
+def out_of_core_edges(incidence, weighted, directory, options=None):
+    result = project_out_of_core(incidence, str(directory), weighted=weighted, memory_budget=64 * 1024, max_workers=2,
+                                 options=options)
+    return concatenate(iter_edge_runs(result['directory']), 3 if weighted else 2)
+
+
+def to_contributor_ids(edges, contributor_ids):
+    """Edges between rows of the incidence matrix as edges between contributor ids, like the SQL ones."""
+    edges = edges.copy()
+    edges[:, :2] = contributor_ids[edges[:, :2]]
+    return edges
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_engines_give_identical_edges(db_manager, synthetic_category, tmp_path, weighted):
+    expected = reference_edges(db_manager, synthetic_category, weighted)
+    contributor_ids, incidence = load_incidence(db_manager, synthetic_category)
+    assert len(expected)
+    np.testing.assert_array_equal(sql_edges(db_manager, synthetic_category, weighted), expected)
+    np.testing.assert_array_equal(to_contributor_ids(sparse_edges(incidence, weighted), contributor_ids), expected)
+    np.testing.assert_array_equal(to_contributor_ids(out_of_core_edges(incidence, weighted, tmp_path), contributor_ids), expected)
+
+
+@pytest.mark.parametrize('options', [
+    ProjectionOptions(max_page_contributors=20),
+    ProjectionOptions(weighting='newman'),
+    ProjectionOptions(backbone='disparity', alpha=0.3),
+    ProjectionOptions(backbone='hypergeometric', alpha=0.3),
+])
+def test_out_of_core_matches_sparse_with_options(db_manager, synthetic_category, tmp_path, options):
+    _, incidence = load_incidence(db_manager, synthetic_category)
+    sparse = sparse_edges(incidence, True, options)
+    assert len(sparse)
+    np.testing.assert_allclose(out_of_core_edges(incidence, True, tmp_path, options), sparse)
+
+
+def test_empty_category_has_no_edges(db_manager, tmp_path):
+    main_category_id = db_manager.get_or_create_main_category('Empty').id
+    _, incidence = load_incidence(db_manager, main_category_id)
+    assert not len(sql_edges(db_manager, main_category_id, True))
+    assert not len(sparse_edges(incidence, True))
+    assert not len(out_of_core_edges(incidence, True, tmp_path))
@@ -0,0 +1,103 @@
+import threading
+import time
+from email.utils import formatdate
+
+import requests
+
+from src.acquisition.request_scheduler import RequestScheduler, _parse_retry_after
+
+
+def response(status_code, headers=None):
+    result = requests.Response()
+    result.status_code = status_code
+    result.headers.update(headers or {})
+    result._content = b'{}'
+    return result
+
+
+class Server:
+    """send() stand-in answering with the given status codes in turn, then with 200."""
+
+    def __init__(self, *statuses, headers=None):
+        self.statuses = list(statuses)
+        self.headers = headers
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.statuses:
+            return response(self.statuses.pop(0), self.headers)
+        return response(200)
+
+
+def test_throttled_requests_are_retried_and_halve_the_concurrency():
+    scheduler = RequestScheduler(max_concurrency=8, backoff_base=0)
+    server = Server(429, 503)
+
+    assert scheduler.execute(server).status_code == 200
+    assert server.calls == 3
+    metrics = scheduler.get_metrics()
+    assert (metrics['retries'], metrics['throttled'], metrics['errors']) == (2, 1, 1)
+    assert metrics['concurrency_limit'] == 2
+
+
+def test_the_last_response_is_returned_once_the_retries_are_used_up():
+    scheduler = RequestScheduler(max_retries=2, backoff_base=0)
+    server = Server(503, 503, 503, 503)
+
+    assert scheduler.execute(server).status_code == 503
+    assert server.calls == 3
+
+
+def test_a_maxlag_error_is_retried():
+    scheduler = RequestScheduler(backoff_base=0)
+    server = Server(200, headers={'MediaWiki-API-Error': 'maxlag'})
+
+    assert scheduler.execute(server).status_code == 200
+    assert server.calls == 2
+
+
+def test_retry_after_pauses_all_requests():
+    scheduler = RequestScheduler(backoff_base=0)
+    start = time.monotonic()
+    scheduler.execute(Server(429, headers={'Retry-After': '0.2'}))
+    assert time.monotonic() - start >= 0.2
+
+
+def test_retry_after_is_seconds_or_an_http_date():
+    assert _parse_retry_after('3') == 3.0
+    assert 8 < _parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert _parse_retry_after('soon') is None
+    assert _parse_retry_after(None) is None
+
+
+def test_requests_in_flight_stay_within_the_limit():
+    scheduler = RequestScheduler(max_concurrency=3)
+    lock = threading.Lock()
+    in_flight, most = 0, 0
+
+    def send():
+        nonlocal in_flight, most
+        with lock:
+            in_flight += 1
+            most = max(most, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return response(200)
+
+    threads = [threading.Thread(target=scheduler.execute, args=(send,)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert most <= 3
+    assert scheduler.get_metrics()['requests'] == 20
+
+
+def test_requests_are_paced():
+    scheduler = RequestScheduler(requests_per_second=50)
+    start = time.monotonic()
+    for _ in range(6):
+        scheduler.execute(Server())
+    assert time.monotonic() - start >= 5 / 50
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('graph_tool')
+
+from src.acquisition.graph_tool.temporal_graph_builder import TemporalGraphBuilder
+
+
+def add_revisions(db_manager, category, revisions):
+    """Store (revision id, page id, username, timestamp) revisions of a new main category."""
+    main_category_id = db_manager.get_or_create_main_category(category).id
+    for revision_id, page_id, username, timestamp in revisions:
+        db_manager.add_page(page_id, f'Page {page_id}')
+        db_manager.add_revision(revision_id, page_id, username, timestamp, main_category_id)
+    db_manager.flush()
+    return main_category_id
+
+
+@pytest.fixture
+def quiet_quarter(db_manager):
+    # Nothing happens in the second quarter, so the second window of two quarters neither gains nor loses revisions
+    add_revisions(db_manager, 'Temporal', [
+        (1, 1, 'alice', '2020-01-10T00:00:00Z'),
+        (2, 1, 'bob', '2020-02-10T00:00:00Z'),
+        (3, 1, 'bob', '2020-03-10T00:00:00Z'),
+        (4, 2, 'bob', '2020-07-10T00:00:00Z'),
+        (5, 2, 'carol', '2020-08-10T00:00:00Z'),
+    ])
+    return db_manager
+
+
+def replay(deltas):
+    """Edge weights after every window, rebuilt from the delta stream."""
+    state, states = {}, []
+    for _, _, changes in deltas:
+        for row, column, weight in changes:
+            if weight:
+                state[(row, column)] = weight
+            else:
+                state.pop((row, column))
+        states.append(dict(state))
+    return states
+
+
+def edge_weights(edges):
+    """Weights of snapshot edges, which only have a weight column in weighted graphs."""
+    return {(row, column): weight[0] if weight else 1 for row, column, *weight in edges.tolist()}
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_deltas_with_an_empty_window(quiet_quarter, weighted):
+    builder = TemporalGraphBuilder(quiet_quarter, 'Temporal', period='quarter', window_periods=2, weighted=weighted)
+    deltas = list(builder.iter_deltas())
+    snapshots = list(builder.iter_snapshots())
+
+    assert [len(changes) for _, _, changes in deltas] == [1, 0, 2]
+    assert deltas[1][2].shape == (0, 3)
+    assert replay(deltas) == [edge_weights(edges) for _, _, edges in snapshots]
+
+
+def test_snapshots_match_the_edges_of_each_window(quiet_quarter):
+    builder = TemporalGraphBuilder(quiet_quarter, 'Temporal', period='quarter', window_periods=2, weighted=True)
+    vertex = {contributor_id: index for index, contributor_id in enumerate(builder.contributor_ids)}
+    for window_start, window_end, edges in builder.iter_snapshots():
+        chunks = quiet_quarter.iter_co_contribution_edges(builder.main_category_id, weighted=True, start=window_start, end=window_end)
+        expected = sorted((vertex[source], vertex[target], weight) for chunk in chunks for source, target, weight in chunk)
+        assert [tuple(edge) for edge in edges] == expected
+
+
+def test_save_deltas_keeps_empty_windows(quiet_quarter, tmp_path):
+    builder = TemporalGraphBuilder(quiet_quarter, 'Temporal', period='quarter', window_periods=2)
+    with np.load(builder.save_deltas(str(tmp_path / 'deltas.npz'))) as deltas:
+        assert len(deltas['windows']) == 3
+        assert np.bincount(deltas['changes'][:, 0], minlength=3).tolist() == [1, 0, 2]
@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from benchmarks.fake_mediawiki import FakeMediaWikiServer, build_synthetic_wiki
+from src.acquisition import wikipedia_crawler
+from src.acquisition.models.models import Revision
+from src.acquisition.wikipedia_crawler import WikipediaCategoryCrawler
+
+# Small enough that most pages need several requests
+REVISIONS_PER_REQUEST = 10
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(wikipedia_crawler, 'REVISIONS_PER_REQUEST', REVISIONS_PER_REQUEST)
+    wiki = build_synthetic_wiki('Synthetic', num_subcategories=2, pages_per_category=6, revisions_per_page=25,
+                                num_users=30, seed=1)
+    server = FakeMediaWikiServer(wiki).start()
+    yield server
+    server.stop()
+
+
+def wiki_revisions(wiki):
+    """Revision ids of every page of the wiki, oldest first."""
+    return {page['pageid']: [revision['revid'] for revision in reversed(page['revisions'])] for page in wiki.pages.values()}
+
+
+def stored_revisions(main_category_id):
+    stored = {}
+    query = Revision.select(Revision.page, Revision.id).where(Revision.main_category == main_category_id).order_by(Revision.id)
+    for page_id, revision_id in query.tuples():
+        stored.setdefault(page_id, []).append(revision_id)
+    return stored
+
+
+def crawl(db_manager, server, broken_pages=(), **kwargs):
+    """Crawl the fake wiki, the pages in broken_pages fail after their first batch of revisions."""
+    crawler = WikipediaCategoryCrawler('Synthetic', db_manager, max_workers=3, site=server.site())
+    fetch = crawler.iter_revision_batches
+
+    def flaky(page):
+        for number, batch in enumerate(fetch(page)):
+            if page.pageid in broken_pages and number == 1:
+                raise ConnectionError('connection reset')
+            yield batch
+
+    crawler.iter_revision_batches = flaky
+    crawler.crawl_category(depth=1, **kwargs)
+    return crawler
+
+
+def test_crawl_stores_every_revision(db_manager, server):
+    crawler = crawl(db_manager, server)
+    crawl_row = db_manager.get_crawl(crawler.crawl_id)
+
+    expected = wiki_revisions(server.wiki)
+    assert stored_revisions(crawler.main_category_id) == {page_id: ids for page_id, ids in expected.items() if ids}
+    assert crawl_row.status == 'completed'
+    assert crawl_row.fetched_revisions == sum(map(len, expected.values()))
+    assert db_manager.get_completed_pages(crawler.crawl_id) == set(expected)
+
+
+def test_resume_continues_failed_pages_after_their_stored_prefix(db_manager, server):
+    expected = wiki_revisions(server.wiki)
+    broken = {page_id for page_id, ids in expected.items() if len(ids) > 2 * REVISIONS_PER_REQUEST}
+    assert broken
+
+    first = crawl(db_manager, server, broken_pages=broken)
+    assert set(first.failed_pages) == broken
+    assert db_manager.get_crawl(first.crawl_id).status == 'running'
+    assert not broken & db_manager.get_completed_pages(first.crawl_id)
+    stored = stored_revisions(first.main_category_id)
+    for page_id in broken:
+        # Only the oldest revisions of a failed page are stored, so there is no gap to fill later
+        assert stored[page_id] == expected[page_id][:REVISIONS_PER_REQUEST]
+
+    second = crawl(db_manager, server, resume=True)
+    crawl_row = db_manager.get_crawl(second.crawl_id)
+    assert second.crawl_id == first.crawl_id
+    assert crawl_row.status == 'completed'
+    assert stored_revisions(second.main_category_id) == {page_id: ids for page_id, ids in expected.items() if ids}
+    assert crawl_row.fetched_revisions == sum(map(len, expected.values()))
+    assert db_manager.get_completed_pages(second.crawl_id) == set(expected)
+
+
+def test_incremental_crawl_fetches_only_new_revisions(db_manager, server):
+    crawl(db_manager, server)
+    title = next(title for title, page in server.wiki.pages.items() if page['revisions'])
+    newest = server.wiki.pages[title]['revisions'][0]['timestamp']
+    edited = datetime.strptime(newest, '%Y-%m-%dT%H:%M:%SZ') + timedelta(days=1)
+    server.wiki.edit_page(title, 'Newcomer', edited)
+    server.wiki.edit_page(title, 'Newcomer', edited + timedelta(hours=1))
+
+    crawler = crawl(db_manager, server, incremental=True)
+    assert db_manager.get_crawl(crawler.crawl_id).fetched_revisions == 2
+    assert stored_revisions(crawler.main_category_id) == {
+        page_id: ids for page_id, ids in wiki_revisions(server.wiki).items() if ids
+    }